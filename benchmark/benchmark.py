@@ -0,0 +1,242 @@
+"""Benchmarks of the modelling hot paths on the shipped input data.
+
+Run from the repository root:
+
+    python -m benchmark.benchmark run --output before.json
+    python -m benchmark.benchmark run --output after.json
+    python -m benchmark.benchmark compare before.json after.json
+
+run records the best and median wall time of --repeat runs and the peak memory (tracemalloc)
+of one further run of every benchmark in a JSON file. compare prints the ratios of two such
+files and exits with 1 if a benchmark got slower or needs more memory than --threshold allows.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from prosumerpolicy.arbitrage import arbitrage_cache
+from prosumerpolicy.input import _Input
+from prosumerpolicy.model import Model
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """registers function(model), which prepares the model and returns the callable to time"""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def _rtp_vfit(model):
+    model.policy.is_rtp = True
+    model.policy.is_vfit = True
+
+
+def _year_optimized(model):
+    model._economics.optimize_year()
+    model._economics._is_optimize_year = True
+
+
+@benchmark
+def input_construction(model):
+    return _Input
+
+
+@benchmark
+def input_loading(model):
+    def run():
+        input = _Input()
+        input.total_prices, input.total_load, input.total_average_load
+        input.pv.pv_generation
+
+    return run
+
+
+@benchmark
+def policy_constants(model):
+    return model.policy._calculate_year_constants
+
+
+@benchmark
+def bau_8760(model):
+    model.time_duration = 8760
+    return model._optimization._bau
+
+
+@benchmark
+def dispatch_day(model):
+    _rtp_vfit(model)
+    model.day = 100
+    return model._optimization._optimizer_dispatch
+
+
+@benchmark
+def optimize_year_bau(model):
+    return model._economics.optimize_year
+
+
+@benchmark
+def optimize_year_rtp_vfit(model):
+    _rtp_vfit(model)
+    return model._economics.optimize_year
+
+
+@benchmark
+def optimize_arbitrage(model):
+    model.day = 1
+    model.time_duration = 8760
+
+    def run():
+        arbitrage_cache.clear()
+        model._optimization._optimize_arbitrage()
+
+    return run
+
+
+@benchmark
+def calculate_csc(model):
+    _rtp_vfit(model)
+    _year_optimized(model)
+
+    def run():
+        arbitrage_cache.clear()
+        model._economics._calculate_csc()
+
+    return run
+
+
+@benchmark
+def calculate_mai(model):
+    _rtp_vfit(model)
+    _year_optimized(model)
+
+    def run():
+        arbitrage_cache.clear()
+        model._economics._calculate_mai()
+
+    return run
+
+
+@benchmark
+def calculate_irr(model):
+    _rtp_vfit(model)
+    _year_optimized(model)
+    return model._economics._calculate_irr
+
+
+def run_benchmark(name, solver="gurobi", repeat=5):
+    """returns best and median seconds, all seconds and peak memory in bytes of benchmark name"""
+    model = Model(solver)
+    run = BENCHMARKS[name](model)
+    run()  # warm up caches and solver models
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": min(seconds),
+        "median_seconds": statistics.median(seconds),
+        "repeats": seconds,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_benchmarks(names=None, solver="gurobi", repeat=5):
+    """runs the benchmarks names (default: all) and returns the results with run metadata"""
+    if names is None:
+        names = list(BENCHMARKS)
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, solver, repeat)
+        print(
+            "{:<24} {:>10.4f} s {:>10.1f} MiB".format(
+                name,
+                results[name]["seconds"],
+                results[name]["peak_memory_bytes"] / 2**20,
+            )
+        )
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "solver": solver,
+            "repeat": repeat,
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(before, after, threshold=0.2):
+    """returns rows (name, time ratio, memory ratio, regressed) of the benchmarks in both results
+
+    A benchmark regressed if its best time or its peak memory grew by more than threshold.
+    """
+    rows = []
+    for name, new in after["benchmarks"].items():
+        old = before["benchmarks"].get(name)
+        if old is None:
+            continue
+        time_ratio = new["seconds"] / old["seconds"]
+        memory_ratio = new["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1)
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        rows.append((name, time_ratio, memory_ratio, regressed))
+    return rows
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run benchmarks and write results")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--solver", default="gurobi", choices=("gurobi", "highs"))
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run"
+    )
+    compare_parser = commands.add_parser("compare", help="compare two results")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+    arguments = parser.parse_args(arguments)
+
+    if arguments.command == "run":
+        warnings.simplefilter("ignore")
+        results = run_benchmarks(arguments.only, arguments.solver, arguments.repeat)
+        with open(arguments.output, "w") as stream:
+            json.dump(results, stream, indent=2)
+        return 0
+    with open(arguments.before) as stream:
+        before = json.load(stream)
+    with open(arguments.after) as stream:
+        after = json.load(stream)
+    rows = compare(before, after, arguments.threshold)
+    print("{:<24} {:>8} {:>8}".format("benchmark", "time", "memory"))
+    for name, time_ratio, memory_ratio, regressed in rows:
+        print(
+            "{:<24} {:>7.2f}x {:>7.2f}x{}".format(
+                name, time_ratio, memory_ratio, "  REGRESSION" if regressed else ""
+            )
+        )
+    return 1 if any(row[3] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import collections
+import hashlib
+
+import numpy as np
+
+""" Exact price arbitrage of a single storage without an LP solver """
+
+_EPS = 1e-12
+
+
+def arbitrage_dispatch(
+    prices,
+    size,
+    maximum_charge_discharge_capacity,
+    charge_efficiency,
+    discharge_efficiency,
+    self_discharge,
+):
+    """Optimal arbitrage of a battery that starts empty, same problem as _arbitrage_program.
+
+    The value of the stored energy from hour t to the end of the horizon is a concave piecewise
+    linear function of the state of charge. It is computed backwards in time: each hour adds the
+    two slopes of the hourly revenue (charging at price/charge_efficiency, discharging at
+    price*discharge_efficiency) to the sorted slopes of the next hour's function, which is then cut to the
+    feasible states and scaled by the self discharge. A forward pass picks the best state of charge
+    for every hour. Cost grows with hours times number of slopes, no solver is involved.
+
+    returns energy from the grid, energy into the grid and battery state per hour as arrays, and
+    the revenue
+    """
+    prices = np.asarray(prices, dtype=float)
+    hours = len(prices)
+    size = float(size)
+    power = float(maximum_charge_discharge_capacity)
+    eta_charge = float(charge_efficiency)
+    eta_discharge = float(discharge_efficiency)
+    retention = 1 - float(self_discharge)
+    if hours == 0 or size <= 0 or power <= 0:
+        zeros = np.zeros(hours)
+        return zeros, zeros.copy(), zeros.copy(), 0.0
+
+    # hourly revenue g(u) of a net change u = eta_charge*charge - discharge/eta_discharge in [-power, power]:
+    # concave with slope first on [-power, 0] and second on [0, power]
+    first, second, value_at_minus_power = [], [], []
+    for price in prices.tolist():
+        slope_discharge = -price * eta_discharge
+        slope_charge = -price / eta_charge
+        first.append(max(slope_discharge, slope_charge))
+        second.append(min(slope_discharge, slope_charge))
+        value_at_minus_power.append(price * eta_discharge * power)  # g(-power)
+
+    # value function on [0, size]: value at 0 and (length, slope) segments in decreasing slope order
+    value, segments = 0.0, [(size, 0.0)]
+    functions = [None] * hours  # value function of hour t+1
+    for t in range(hours - 1, -1, -1):
+        functions[t] = (value, segments)
+        # W(x) = max_s V(s) + g(s - x) is the sup-convolution of V with g(-v), which starts at -power
+        # and has the slopes -second and -first over length power each
+        value += value_at_minus_power[t] + power * (first[t] + second[t])
+        segments = _merge(segments, [(power, -second[t]), (power, -first[t])])
+        # keep x in [0, retention*size], then V_t(s) = W(retention * s)
+        value, segments = _restrict(segments, value, -power, retention * size)
+        if retention != 1:
+            segments = [
+                (length / retention, slope * retention) for length, slope in segments
+            ]
+
+    charge = np.zeros(hours)
+    discharge = np.zeros(hours)
+    storage = np.zeros(hours)
+    state = 0.0
+    for t in range(hours):
+        x = retention * state
+        low, high = max(0.0, x - power), min(size, x + power)
+        # the objective is concave in the new state, its maximum is at a breakpoint
+        candidates = [low, high, min(max(x, low), high)]
+        value, segments = functions[t]
+        position = 0.0
+        for length, _ in segments:
+            position += length
+            if low < position < high:
+                candidates.append(position)
+        best, best_total = None, -np.inf
+        for candidate in candidates:
+            u = candidate - x
+            total = (
+                value_at_minus_power[t]
+                + first[t] * (min(u, 0.0) + power)
+                + second[t] * max(u, 0.0)
+                + _evaluate(value, segments, candidate)
+            )
+            tolerance = _EPS * (1 + abs(total))
+            if total > best_total + tolerance or (
+                total >= best_total - tolerance and abs(u) < abs(best - x)
+            ):  # ties: least activity
+                best, best_total = candidate, total
+        change = best - x
+        if prices[t] >= 0:  # either charge or discharge
+            charge[t] = max(change, 0.0) / eta_charge
+            discharge[t] = max(-change, 0.0) * eta_discharge
+        else:  # negative prices: charge as much as possible, discharge the excess
+            charge[t] = (power + min(change, 0.0)) / eta_charge
+            discharge[t] = eta_discharge * (power - max(change, 0.0))
+        storage[t] = state = best
+    return charge, discharge, storage, float(np.dot(prices, discharge - charge))
+
+
+def _merge(segments, new_segments):
+    """merges two lists of (length, slope) segments sorted by decreasing slope"""
+    merged = list(segments)
+    for segment in new_segments:
+        i = len(merged)
+        while i > 0 and merged[i - 1][1] < segment[1]:
+            i -= 1
+        merged.insert(i, segment)
+    return merged
+
+
+def _restrict(segments, value, start, high):
+    """cuts a piecewise linear function with the given value at start to [0, high]
+
+    returns value at 0 and the remaining segments
+    """
+    restricted = []
+    begin = start
+    for length, slope in segments:
+        end = begin + length
+        if end <= 0.0:
+            value += length * slope
+        else:
+            if begin < 0.0:
+                value -= begin * slope
+            cut = min(end, high) - max(begin, 0.0)
+            if cut > _EPS:
+                restricted.append((cut, slope))
+            if end >= high:
+                break
+        begin = end
+    return value, restricted
+
+
+def _evaluate(value, segments, x):
+    """value of a piecewise linear function starting at 0 at x"""
+    position = 0.0
+    for length, slope in segments:
+        if position + length >= x:
+            return value + (x - position) * slope
+        value += length * slope
+        position += length
+    return value
+
+
+class _ArbitrageCache:
+    """least recently used cache of arbitrage results, holds at most maxsize entries
+
+    The arbitrage reference only depends on the price series and the battery, not on load,
+    PV or policy, so all scenarios of a sweep with the same prices and battery share one entry.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prices, battery, method):
+        prices = np.ascontiguousarray(prices, dtype=float)
+        return (
+            hashlib.sha1(prices.tobytes()).hexdigest(),
+            len(prices),
+            float(battery.size),
+            float(battery.maximum_charge_discharge_capacity),
+            float(battery.charge_efficiency),
+            float(battery.discharge_efficiency),
+            float(battery.self_discharge),
+            method,
+        )
+
+    def get(self, key):
+        """returns the cached result of key or None"""
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        """stores result, a tuple of arrays which are made read-only, and evicts the oldest entries"""
+        for array in result:
+            array.flags.writeable = False
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+arbitrage_cache = _ArbitrageCache()  # shared by all models of the process
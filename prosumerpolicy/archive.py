@@ -0,0 +1,132 @@
+import json
+import os
+
+import numpy as np
+
+from prosumerpolicy.results import _FlowResult
+
+""" Hourly flows of many scenarios, streamed to chunked .npy files and read back memory mapped """
+
+_INDEX = "index.jsonl"
+
+
+class FlowWriter:
+    """writes the hourly flows (_FlowResult) of scenarios into the directory path as they arrive
+
+    Flows are buffered per set of columns. As soon as a buffer holds buffer_hours hours it is
+    written as one (columns x hours) .npy chunk, so at most about buffer_hours hours per set of
+    columns are held in memory. Every chunk appends one line with its columns and scenarios to
+    index.jsonl, an archive can be read with FlowArchive while it grows. close, or the end of a
+    with block, writes the remaining buffers.
+    """
+
+    def __init__(self, path, buffer_hours=24 * 8760):
+        if os.path.exists(os.path.join(path, _INDEX)):
+            raise FileExistsError("Flow archive {} exists already".format(path))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.buffer_hours = buffer_hours
+        # columns: (scenario entries, (columns x hours) arrays, hours)
+        self._buffers = {}
+        self._written = 0  # scenarios
+        self._chunks = 0
+
+    def write(self, flows, scenario=None):
+        """adds flows, a _FlowResult, with the scenario dict describing it"""
+        values = np.asarray(flows.values, dtype=float)
+        entries, arrays, hours = self._buffers.get(flows.columns, ([], [], 0))
+        entries.append(
+            {"id": self._written, "hours": values.shape[1], "scenario": scenario or {}}
+        )
+        arrays.append(values)
+        self._buffers[flows.columns] = (entries, arrays, hours + values.shape[1])
+        self._written += 1
+        if hours + values.shape[1] >= self.buffer_hours:
+            self._flush(flows.columns)
+
+    def _flush(self, columns):
+        entries, arrays, _ = self._buffers.pop(columns)
+        name = "chunk_{:05d}.npy".format(self._chunks)
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        with open(tmp_path, "wb") as stream:
+            np.save(stream, np.hstack(arrays))
+        os.replace(tmp_path, os.path.join(self.path, name))
+        start = 0
+        for entry in entries:
+            entry["start"] = start
+            start += entry["hours"]
+        line = json.dumps(
+            {"chunk": name, "columns": list(columns), "scenarios": entries},
+            default=lambda value: value.item(),  # numpy scalars of scenario grids
+        )
+        with open(os.path.join(self.path, _INDEX), "a") as stream:
+            stream.write(line + "\n")
+        self._chunks += 1
+
+    def close(self):
+        for columns in list(self._buffers):
+            self._flush(columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class FlowArchive:
+    """reads the directory of a FlowWriter, chunks are memory mapped on first use
+
+    archive[i] is the _FlowResult of the i-th written scenario, its values are a view of the
+    memory map, and archive.scenarios the scenario dicts in the same order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        entries = []
+        with open(os.path.join(path, _INDEX), "r") as stream:
+            for line in stream:
+                if not line.endswith("\n"):  # being written
+                    break
+                chunk = json.loads(line)
+                for entry in chunk["scenarios"]:
+                    entries.append(
+                        (
+                            entry["id"],
+                            chunk["chunk"],
+                            tuple(chunk["columns"]),
+                            entry["start"],
+                            entry["hours"],
+                            entry["scenario"],
+                        )
+                    )
+        entries.sort(key=lambda entry: entry[0])
+        self._entries = entries
+        self.scenarios = [entry[-1] for entry in entries]
+        self._chunks = {}  # name: memory map
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        _, name, columns, start, hours, _ = self._entries[index]
+        if name not in self._chunks:
+            self._chunks[name] = np.load(os.path.join(self.path, name), mmap_mode="r")
+        return _FlowResult.from_values(
+            columns, self._chunks[name][:, start : start + hours]
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def stack(self, column):
+        """returns (scenarios x hours) array of column for all scenarios, e.g. for the functions of
+        kpi, scenarios without column or of other length raise ValueError"""
+        series = []
+        for result in self:
+            if column not in result.columns:
+                raise ValueError("Column {} not in all scenarios".format(column))
+            series.append(result[column])
+        return np.stack(series)
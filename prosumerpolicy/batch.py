@@ -0,0 +1,128 @@
+import numpy as np
+
+
+def batch_bau(
+    net_load,
+    size,
+    maximum_charge_discharge_capacity,
+    charge_efficiency,
+    discharge_efficiency,
+    self_discharge,
+    initial_battery_capacity,
+):
+    """Rule based (BAU) battery dispatch for a batch of households and systems.
+
+    net_load is a 2-D array (batch x hours) of PV generation minus load in kW.
+    Battery parameters are scalars or 1-D arrays with one entry per batch row.
+    The hourly recursion is the one of _Optimization._bau, evaluated for all
+    rows at once.
+
+    returns a dict of (batch x hours) arrays: battery state at the end of each
+    hour, battery state at the beginning of each hour (after self discharge),
+    energy from the grid and energy into the grid
+    """
+    net_load = np.atleast_2d(np.asarray(net_load, dtype=float))
+    rows, hours = net_load.shape
+
+    def _per_row(value):
+        return np.broadcast_to(np.asarray(value, dtype=float), (rows,))
+
+    size = _per_row(size)
+    capacity = _per_row(maximum_charge_discharge_capacity)
+    eta_charge = _per_row(charge_efficiency)
+    eta_discharge = _per_row(discharge_efficiency)
+    retention = 1 - _per_row(self_discharge)
+
+    if rows == 1:  # plain floats are faster than array operations on a single row
+        flows = _bau_row(
+            net_load[0].tolist(),
+            float(size[0]),
+            float(capacity[0]),
+            float(eta_charge[0]),
+            float(eta_discharge[0]),
+            float(retention[0]),
+            float(_per_row(initial_battery_capacity)[0]),
+        )
+        return {key: np.array([value]) for key, value in flows.items()}
+
+    batt_state = np.empty((rows, hours))
+    batt_at_beg = np.empty((rows, hours))
+    energy_from_grid = np.empty((rows, hours))
+    energy_to_grid = np.empty((rows, hours))
+
+    # All Efficiencies are taken with reference to the battery. if battery discharges 1kwh, this means it actually gives
+    # etaDischarge*1kwh to the grid...if battery charges by 1 kwh, this means it took 1kwh/etacharge from the grid/pv
+    battery_state = _per_row(initial_battery_capacity).copy()
+    for hour in range(hours):
+        item = net_load[:, hour]
+        battery_state = battery_state * retention
+        batt_at_beg[:, hour] = battery_state
+
+        demand = np.abs(item)
+        discharge = np.minimum(battery_state, capacity)
+        discharge_limit = discharge * eta_discharge
+        covered = demand <= discharge_limit
+        from_grid = np.where(covered, 0.0, demand - discharge_limit)
+        state_discharge = np.where(
+            covered,
+            battery_state - demand / eta_discharge,
+            battery_state - discharge,
+        )
+
+        charge = np.minimum(size - battery_state, capacity)
+        charge_limit = charge / eta_charge
+        saturated = item >= charge_limit
+        to_grid = np.where(saturated, item - charge_limit, 0.0)
+        state_charge = np.where(
+            saturated,
+            battery_state + charge,
+            battery_state + item * eta_charge,
+        )
+
+        is_deficit = item <= 0
+        battery_state = np.where(is_deficit, state_discharge, state_charge)
+        batt_state[:, hour] = battery_state
+        energy_from_grid[:, hour] = np.where(is_deficit, from_grid, 0.0)
+        energy_to_grid[:, hour] = np.where(is_deficit, 0.0, to_grid)
+
+    return {
+        "battery_state": batt_state,
+        "battery_at_beginning": batt_at_beg,
+        "energy_from_grid": energy_from_grid,
+        "energy_to_grid": energy_to_grid,
+    }
+
+
+def _bau_row(
+    net_load, size, capacity, eta_charge, eta_discharge, retention, battery_state
+):
+    """hourly recursion of batch_bau for a single row given as list of floats"""
+    batt_state, batt_at_beg, energy_from_grid, energy_to_grid = [], [], [], []
+    for item in net_load:
+        battery_state *= retention
+        batt_at_beg.append(battery_state)
+        if item <= 0:
+            discharge = min(battery_state, capacity)
+            if -item <= discharge * eta_discharge:
+                battery_state = battery_state - (-item / eta_discharge)
+                energy_from_grid.append(0.0)
+            else:
+                energy_from_grid.append(-item - discharge * eta_discharge)
+                battery_state = battery_state - discharge
+            energy_to_grid.append(0.0)
+        else:
+            charge = min(size - battery_state, capacity)
+            if item >= charge / eta_charge:
+                energy_to_grid.append(item - charge / eta_charge)
+                battery_state = battery_state + charge
+            else:
+                battery_state = battery_state + item * eta_charge
+                energy_to_grid.append(0.0)
+            energy_from_grid.append(0.0)
+        batt_state.append(battery_state)
+    return {
+        "battery_state": batt_state,
+        "battery_at_beginning": batt_at_beg,
+        "energy_from_grid": energy_from_grid,
+        "energy_to_grid": energy_to_grid,
+    }
@@ -4,7 +4,7 @@ from prosumerpolicy.paths import *
 class Battery(object):
     def __init__(self, path=None):
         """Sets parameter from default values"""
-        logging.info("battery config is set")
+        logger.info("battery config is set")
         self._size = None
         self.charge_efficiency = None
         self.discharge_efficiency = None
@@ -0,0 +1,93 @@
+import numpy as np
+
+from prosumerpolicy.paths import *
+
+""" Net present value and internal rate of return for arrays of scenarios and discount rates """
+
+NO_REPLACEMENT_YEAR = 100  # replacement year of batteries that are never cycled
+
+
+def replacement_year(total_battery_cycles, cycles_per_year):
+    """year in which the battery reaches its total cycles and is replaced, elementwise"""
+    total_battery_cycles = np.asarray(total_battery_cycles, dtype=float)
+    cycles_per_year = np.asarray(cycles_per_year, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        years = np.floor(total_battery_cycles / cycles_per_year)
+    return np.where(cycles_per_year == 0, NO_REPLACEMENT_YEAR, years).astype(int)[()]
+
+
+def npv(discount, investment, annual, annual_replacement, replacement_year, lifetime):
+    """net present value of investment in year 0 and the annual cash flow in the years 1 to lifetime
+
+    In the replacement year annual_replacement is paid instead of annual. All arguments but
+    lifetime are broadcast against each other, e.g. discount of shape (n, 1) and scenarios of
+    shape (m,) give a (n x m) table in one pass.
+    """
+    discount, investment, annual, annual_replacement, replacement_year = (
+        np.broadcast_arrays(
+            np.asarray(discount, dtype=float),
+            np.asarray(investment, dtype=float),
+            np.asarray(annual, dtype=float),
+            np.asarray(annual_replacement, dtype=float),
+            np.asarray(replacement_year),
+        )
+    )
+    years = np.arange(1, int(lifetime) + 1)
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        factors = (1.0 + discount[..., None]) ** -years
+        flows = np.where(
+            replacement_year[..., None] == years,
+            annual_replacement[..., None],
+            annual[..., None],
+        )
+        return (investment + (flows * factors).sum(axis=-1))[()]
+
+
+def irr(
+    investment,
+    annual,
+    annual_replacement,
+    replacement_year,
+    lifetime,
+    low=-0.99,
+    high=1.0,
+    points=200,
+    iterations=60,
+):
+    """internal rate of return, the discount rate in [low, high] at which npv is zero, elementwise
+
+    The rates are scanned on a grid of points rates for the lowest sign change of npv, which is
+    then narrowed down by bisection. Scenarios without a sign change get nan and a warning.
+    """
+    scenarios = np.broadcast_arrays(
+        np.asarray(investment, dtype=float),
+        np.asarray(annual, dtype=float),
+        np.asarray(annual_replacement, dtype=float),
+        np.asarray(replacement_year),
+    )
+    shape = scenarios[0].shape
+    scenarios = [values.ravel() for values in scenarios]
+    grid = np.linspace(low, high, points)
+    values = npv(grid[:, None], *scenarios, lifetime)  # points x scenarios
+    change = np.sign(values[:-1]) != np.sign(values[1:])
+    found = change.any(axis=0)
+    first = np.argmax(change, axis=0)
+    columns = np.arange(len(first))
+    lower = grid[first]
+    upper = grid[first + 1]
+    lower_value = values[first, columns]
+    for _ in range(iterations):
+        middle = (lower + upper) / 2
+        middle_value = npv(middle, *scenarios, lifetime)
+        same_sign = np.sign(middle_value) == np.sign(lower_value)
+        lower = np.where(same_sign, middle, lower)
+        lower_value = np.where(same_sign, middle_value, lower_value)
+        upper = np.where(same_sign, upper, middle)
+    rates = np.where(found, (lower + upper) / 2, np.nan)
+    if not found.all():
+        logger.warning(
+            "IRR not found in [{}, {}] for {} of {} scenarios".format(
+                low, high, np.count_nonzero(~found), found.size
+            )
+        )
+    return rates.reshape(shape)[()]
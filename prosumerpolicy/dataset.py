@@ -0,0 +1,111 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+""" Immutable input data of models, shared between processes without copies """
+
+_FIELDS = ("prices", "pv_profile", "load", "average_load")
+_ALIGNMENT = 64  # bytes, start of every array in shared memory
+
+
+class Dataset:
+    """hourly prices, PV profile per unit, load profiles (hours x households) and average load
+
+    The arrays are read-only. Models created with Model(dataset=...) use them instead of reading
+    the input files. share() publishes the dataset into shared memory once, other processes map it
+    with Dataset.attach(handle) without copying, e.g. the workers of a sweep.
+    The arrays of a dataset on shared memory are only valid as long as the dataset is referenced
+    and not closed, models keep their dataset.
+    """
+
+    def __init__(self, prices, pv_profile, load, average_load, memory=None):
+        """memory is the SharedMemory the arrays are on, if any, it is closed by close"""
+        for name, values in zip(_FIELDS, (prices, pv_profile, load, average_load)):
+            values = np.asarray(values, dtype=float).view()
+            values.flags.writeable = False
+            setattr(self, name, values)
+        self._memory = memory
+
+    @classmethod
+    def from_input(cls, input):
+        """dataset of the data an _Input reads"""
+        return cls(
+            input.total_prices["Price"],
+            input.total_pv_gen[0],
+            input.total_load,
+            input.total_average_load,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in _FIELDS)
+
+    def share(self):
+        """copies the dataset into a new block of shared memory, returns its SharedDataset"""
+        return SharedDataset(self)
+
+    @classmethod
+    def attach(cls, handle):
+        """dataset on the shared memory of handle (SharedDataset.handle) without copying"""
+        name, layout = handle
+        try:  # Python 3.13+: the owner alone unlinks the memory
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            memory = shared_memory.SharedMemory(name=name)
+        return cls(*_arrays(memory.buf, layout), memory=memory)
+
+    def close(self):
+        """releases the arrays and unmaps the shared memory of the dataset, no model may use it
+        any more"""
+        for name in _FIELDS:
+            setattr(self, name, None)
+        if self._memory is not None:
+            self._memory.close()
+            self._memory = None
+
+
+class SharedDataset:
+    """a Dataset published into shared memory by the current process
+
+    handle is small and picklable, pass it to other processes for Dataset.attach. close, or the
+    end of a with block, closes dataset and removes the name of the memory, it is freed once the
+    datasets attached by other processes are closed or garbage collected.
+    """
+
+    def __init__(self, dataset):
+        layout = []
+        size = 0
+        for name in _FIELDS:
+            values = getattr(dataset, name)
+            layout.append((values.shape, size))
+            size += -(-values.nbytes // _ALIGNMENT) * _ALIGNMENT
+        self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.handle = (self._memory.name, tuple(layout))
+        for target, name in zip(_arrays(self._memory.buf, layout, True), _FIELDS):
+            target[...] = getattr(dataset, name)
+        self.dataset = Dataset(*_arrays(self._memory.buf, layout), memory=self._memory)
+
+    def close(self):
+        self.dataset.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _arrays(buffer, layout, writeable=False):
+    """arrays of layout, ((shape, offset) per field), on buffer, e.g. SharedMemory.buf
+
+    SharedMemory unmaps its memory when it is closed or garbage collected, even if arrays still
+    use it, so it has to be kept as long as the arrays, see Dataset.
+    """
+    arrays = []
+    for shape, offset in layout:
+        values = np.ndarray(shape, dtype=float, buffer=buffer, offset=offset)
+        values.flags.writeable = writeable
+        arrays.append(values)
+    return arrays
@@ -1,8 +1,10 @@
-import math
-
 import numpy as np
 
+from prosumerpolicy import kpi, sizing
+from prosumerpolicy.cashflow import irr, npv, replacement_year
+from prosumerpolicy.optimization import _shift_dispatch_solution
 from prosumerpolicy.paths import *
+from prosumerpolicy.results import _FlowResult
 
 
 class Economics:
@@ -18,6 +20,16 @@ class Economics:
         self._self_consumption = None
         self._avoided_network_fees = None
         self._is_optimize_year = False
+        self.workers = 1  # worker threads for the daily optimizations of optimize_year
+        # solver threads per worker, None shares the cores among the workers
+        self.threads = None
+        # optimize_year with limited foresight: windows of optimization_foresight_hours, of which
+        # rolling_step_days days are kept before the window moves on
+        self.rolling_horizon = False
+        self.rolling_step_days = 1
+        # optimize_year in blocks of block_days days (e.g. 7, 30 or 365) each starting at the final
+        # state of charge of the previous one, None solves independent days
+        self.block_days = None
         self._set_economic_parameters_from_file()
 
     def _set_economic_parameters_from_file(self, path=None):
@@ -82,75 +94,51 @@ class Economics:
             avoided_network_fees = sum(self_produced) * self._policy.network_charge
             return avoided_network_fees
 
+    def optimize_size(self, optimize_pv=False, power_cost=None, days=None, **options):
+        """cost optimal battery (and PV) size of one LP over the year, see sizing.optimize_size"""
+        return sizing.optimize_size(self, optimize_pv, power_cost, days, **options)
+
+    def _cash_flows(self):
+        """returns investment, annual cash flow, annual cash flow in the battery replacement year and
+        the replacement year, relative to the reference without PV and battery"""
+        PV = self._pv_initial_cost()
+        Bat = self._battery_initial_cost()
+        investment = (-PV - Bat) * self._vat  # initial investment in year 0
+        annual = (
+            self.revenue_total
+            - self._o_and_m_pv * PV
+            - self._o_and_m_bat * Bat
+            - self.reference_total
+        )
+        annual_replacement = (
+            self.revenue_total
+            - self._o_and_m_pv * PV
+            - Bat * self._vat * self.battery.replacement_cost_factor
+            - self.reference_total
+        )
+        battery_year = replacement_year(
+            self.battery.total_battery_cycles, self.num_of_cycles
+        )  # number of years to change battery.
+        return investment, annual, annual_replacement, battery_year
+
     def _calculate_npv(self, discount=None):
+        """net present value, discount may be an array of rates"""
         if discount is None:
             discount = self._discount
-        PV = self._pv_initial_cost()
-        Bat = self._battery_initial_cost()
-        cost = (-PV - Bat) * self._vat  # initial investment in year 0
-        logging.info("Net Present Value for {} years calculated".format(self._lifetime))
-        if self.num_of_cycles == 0:
-            battery_year = 100
-        else:
-            battery_year = (
-                self.battery.total_battery_cycles / self.num_of_cycles
-            )  # number of years to change battery.
-            battery_year = int(battery_year)
-        for year in range(1, int(self._lifetime + 1)):
-            ref_year_cost = self.reference_total / math.pow(1.0 + discount, year)
-            if year == battery_year:
-                logging.warning("Battery is Changed")
-                year_cost = (
-                    self.revenue_total
-                    - self._o_and_m_pv * PV
-                    - Bat * self._vat * self.battery.replacement_cost_factor
-                )
-            else:
-                year_cost = (
-                    self.revenue_total - self._o_and_m_pv * PV - self._o_and_m_bat * Bat
-                )
-            year_cost = year_cost / math.pow(1.0 + discount, year)
-            cost += year_cost - ref_year_cost
-        return cost
+        logger.info("Net Present Value for {} years calculated".format(self._lifetime))
+        return npv(discount, *self._cash_flows(), self._lifetime)
 
     def _calculate_irr(self):
-        x0 = -0.05
-        x1 = -0.2
-        x2 = -1
-        threshold = 0.5
-        sol_delta = 100 * threshold
-        valid_run = False
-        for _ in range(100):
-            try:
-                x2 = x1 - (x1 - x0) / (
-                    self._calculate_npv(discount=x1) - self._calculate_npv(discount=x0)
-                ) * self._calculate_npv(discount=x1)
-                sol_delta = self._calculate_npv(discount=x2)
-                x0 = x1
-                x1 = x2
-                if abs(sol_delta) < threshold:
-                    valid_run = True
-                    return x2
-            except OverflowError:
-                logging.warning("IRR Divergent")
-                break
-        if not valid_run:
-            return -0.25
+        """internal rate of return, nan if there is none"""
+        return irr(*self._cash_flows(), self._lifetime)
 
     def _calculate_battery_counts(self):
         """calculates battery counts"""
-        tot = np.array(self.battery_total)
-        tot1 = np.insert(tot, 0, self.battery.initial_battery_capacity)
-        tot1 = np.delete(tot1, -1)
-        diff = tot - tot1
-        num_of_cycles = 0
-        z = 0
-        for i in diff:
-            z += abs(i)
-            if z >= 2 * self.battery.size:
-                z = z - 2 * self.battery.size
-                num_of_cycles += 1
-        return num_of_cycles
+        return kpi.battery_cycles(
+            self.battery_total,
+            self.battery.size,
+            self.battery.initial_battery_capacity,
+        )
 
     def _calculate_csc(self):  # charging State Correlator
         """calculates system friendliness indicator. After optimization of existing case the arbitrage case is optimized for entire year"""
@@ -165,16 +153,13 @@ class Economics:
             self._optimization.energy_storage_arbitrage
         )
         optimize_charging = self._calculate_battery_state(self.energy_storage)
-        logging.info(
+        logger.info(
             "System Friendliness Indicator for Arbitrage and {} calculated ".format(
                 self._optimization.optimization_state
             )
         )
         assert len(arbitrage_charging) == len(optimize_charging)
-        diff = 1 - sum(
-            (arbitrage_charging[i] - optimize_charging[i]) ** 2
-            for i in range(len(arbitrage_charging))
-        ) / (2 * len(arbitrage_charging))
+        diff = kpi.csc(arbitrage_charging, optimize_charging)
         self._input.time_duration = time
         self._input.day = day
         return diff
@@ -199,7 +184,36 @@ class Economics:
         self._input.day = day
         return self.welfare_battery / self.welfare_ref
 
-    def optimize_year(self):
+    def optimize_year(
+        self,
+        workers=None,
+        threads=None,
+        rolling_horizon=None,
+        block_days=None,
+        shadow_prices=False,
+        flows=False,
+    ):
+        """optimizes the dispatch of the whole year and accumulates yearly results
+
+        For RTP/VFIT the daily problems are solved on workers worker threads with threads solver
+        threads each (defaults: attributes workers and threads), results are identical to workers=1.
+        With rolling_horizon (default: attribute rolling_horizon) the year is instead optimized
+        sequentially in windows of optimization_foresight_hours, see _optimize_rolling_horizon.
+        With block_days (default: attribute block_days) it is solved in blocks of block_days days,
+        each starting at the final state of charge of the previous block, fewer and larger solves.
+        With shadow_prices the duals of the RTP/VFIT dispatch are aggregated in shadow_prices, see
+        _aggregate_shadow_prices. With flows the hourly flows of the year are kept in hourly_flows
+        as one _FlowResult, e.g. for FlowWriter. day and time_duration of the input are restored
+        afterwards, also if the optimization fails.
+        """
+        if workers is None:
+            workers = self.workers
+        if threads is None:
+            threads = self.threads
+        if rolling_horizon is None:
+            rolling_horizon = self.rolling_horizon
+        if block_days is None:
+            block_days = self.block_days
         self.revenue_total = 0
         self.reference_total = 0
         self.battery_total = []
@@ -214,44 +228,25 @@ class Economics:
         self.welfare_pv = 0
         self.welfare_consumption = 0
         self.welfare_battery_pv = 0
-        if not self._policy.is_rtp and not self._policy.is_vfit:  # BAU Case
-            time = self._input.time_duration
-            self._input.time_duration = 8760
-            self._optimization.optimize()
-            self.revenue_total = self._optimization.revenue
-            self.reference_total = self._optimization.reference_revenue
-            self.total_avoided_network_fees = self._calculate_avoided_network_fees()
-            self.battery_total = self._optimization.energy_storage
-            self.pv_total = sum(self._input.pv_gen_list)
-            self.consumption_year = sum(self._input.load_list)
-            self.welfare_pv += np.dot(
-                self._input.pv_gen_list, self._input.get_price_list()
-            )
-            self.welfare_consumption -= np.dot(
-                self._input.load_list, self._input.get_price_list()
-            )
-            self.welfare_battery_pv += -np.dot(
-                self._optimization.energy_from_grid_bau, self._input.get_price_list()
-            ) + np.dot(
-                self._optimization.energy_to_grid_bau, self._input.get_price_list()
-            )
-            self._input.time_duration = time
-        else:
-            for d in range(1, 366):
-                self._input.time_duration = 24
-                self._input.day = d
-                self._optimization.optimize()
-                self.delta_batt_grid.append(self._optimization.delta_batt)
-                self.fedin += self._optimization.pv_to_grid
-                self.from_grid += self._optimization.grid_to_load
-                self.revenue_total += self._optimization.revenue
-                self.reference_total += self._optimization.reference_revenue
-                self.battery_total += self._optimization.energy_storage
-                self.total_avoided_network_fees += (
-                    self._calculate_avoided_network_fees()
-                )
-                self.pv_total += sum(self._input.pv_gen_list)
-                self.consumption_year += sum(self._input.load_list)
+        self.shadow_prices = None
+        self._shadow_price_windows = [] if shadow_prices else None
+        self.hourly_flows = None
+        self._flow_windows = [] if flows else None
+        time = self._input.time_duration
+        day = self._input.day
+        try:
+            if not self._policy.is_rtp and not self._policy.is_vfit:  # BAU Case
+                self._input.time_duration = 8760
+                self._input.day = 1
+                bau_flows = self._optimization.optimize()
+                if flows:
+                    self.hourly_flows = bau_flows
+                self.revenue_total = self._optimization.revenue
+                self.reference_total = self._optimization.reference_revenue
+                self.total_avoided_network_fees = self._calculate_avoided_network_fees()
+                self.battery_total = self._optimization.energy_storage
+                self.pv_total = sum(self._input.pv_gen_list)
+                self.consumption_year = sum(self._input.load_list)
                 self.welfare_pv += np.dot(
                     self._input.pv_gen_list, self._input.get_price_list()
                 )
@@ -259,28 +254,140 @@ class Economics:
                     self._input.load_list, self._input.get_price_list()
                 )
                 self.welfare_battery_pv += -np.dot(
-                    self._optimization.sum_energy_from_grid,
+                    self._optimization.energy_from_grid_bau,
                     self._input.get_price_list(),
                 ) + np.dot(
-                    self._optimization.sum_energy_to_grid, self._input.get_price_list()
+                    self._optimization.energy_to_grid_bau, self._input.get_price_list()
+                )
+            elif rolling_horizon:
+                self._optimize_rolling_horizon(
+                    24 * self.rolling_step_days, self._optimization_foresight_hours
                 )
-            self.energy_storage = self.battery_total
+                self.energy_storage = self.battery_total
+            elif block_days is not None:
+                self._optimize_rolling_horizon(24 * block_days, 24 * block_days)
+                self.energy_storage = self.battery_total
+            else:
+                days = range(1, 366)
+                solved = [None] * len(days)
+                if workers > 1:
+                    self._input.time_duration = 24
+                    solved = self._optimization._solve_dispatch_days(
+                        days, workers, threads, shadow_prices
+                    )
+                prices, pv_gen, load = self._day_stacked_inputs()
+                for d, day_solved in zip(days, solved):
+                    self._input.time_duration = 24
+                    self._input.day = d
+                    self._optimization._optimizer_dispatch(
+                        day_solved, shadow_prices=shadow_prices
+                    )
+                    self._accumulate_dispatch(prices[d - 1], pv_gen[d - 1], load[d - 1])
+                self.energy_storage = self.battery_total
+        finally:  # all branches move the optimized window
+            self._input.time_duration = time
+            self._input.day = day
+        if shadow_prices and self._shadow_price_windows:
+            self.shadow_prices = self._aggregate_shadow_prices()
+        self._shadow_price_windows = None
+        if self._flow_windows:
+            self.hourly_flows = _FlowResult.concatenate(self._flow_windows)
+        self._flow_windows = None
         self.num_of_cycles = self._calculate_battery_counts()
         self.revenue_total -= self._policy.fixed_capacity
         self.reference_total -= self._policy.fixed_capacity
 
+    def _optimize_rolling_horizon(self, step, foresight):
+        """optimizes the year in windows of foresight hours with limited foresight
+
+        Each window starts at the state of charge the previous windows left and only its first
+        step hours (whole days) are kept. If windows overlap, the next window starts from the shifted
+        solution of the previous one.
+        """
+        if foresight < step:
+            raise ValueError(
+                "optimization_foresight_hours {} is shorter than the rolling step of {} hours".format(
+                    foresight, step
+                )
+            )
+        prices, pv_gen, load = self._day_stacked_inputs()
+        state = self.battery.initial_battery_capacity
+        start = None
+        hours = 8760
+        for first_hour in range(0, hours, step):
+            self._input.day = first_hour // 24 + 1
+            self._input.time_duration = min(foresight, hours - first_hour)
+            commit = min(step, hours - first_hour)
+            self._optimization._optimizer_dispatch(
+                initial_state=state,
+                commit=commit,
+                start=start,
+                shadow_prices=self._shadow_price_windows is not None,
+            )
+            if commit < self._input.time_duration:
+                start = _shift_dispatch_solution(
+                    self._optimization.dispatch_solution, commit
+                )
+            state = self._optimization.energy_storage[-1]
+            self._input.time_duration = commit
+            days = slice(first_hour // 24, (first_hour + commit) // 24)
+            self._accumulate_dispatch(
+                prices[days].ravel(), pv_gen[days].ravel(), load[days].ravel()
+            )
+
+    def _aggregate_shadow_prices(self):
+        """yearly marginal revenue in EUR per kWh storage capacity ("storage_capacity"), per kW power
+        ("power") and per kWh battery size at constant E2P ratio ("battery_size"), and the hourly
+        values of energy in the storage, PV and load balances
+
+        The duals of the dispatch programs hold at the solved sizes, so these estimate the revenue
+        of sizes nearby without solving them.
+        """
+        windows = self._shadow_price_windows
+        hourly = {
+            name: np.concatenate([window[name] for window in windows])
+            for name in windows[0]
+        }
+        storage_capacity = hourly.pop("storage_capacity").sum()
+        power = hourly.pop("power").sum()
+        return dict(
+            storage_capacity=storage_capacity,
+            power=power,
+            battery_size=storage_capacity + power / self.battery.ratio_e2p,
+            **hourly
+        )
+
+    def _day_stacked_inputs(self):
+        """returns (365 x 24) wholesale prices, PV generation and load of the current scenario"""
+        return (
+            self._input.get_day_stacked("price"),
+            self._input.get_day_stacked("pv_gen"),
+            self._input.get_day_stacked("load"),
+        )
+
+    def _accumulate_dispatch(self, prices, pv_gen, load):
+        """adds the dispatch results of the current window with the given wholesale prices, PV
+        generation and load to the yearly results"""
+        if self._shadow_price_windows is not None:
+            self._shadow_price_windows.append(self._optimization.shadow_prices)
+        if self._flow_windows is not None:
+            self._flow_windows.append(self._optimization.flows)
+        self.delta_batt_grid.append(self._optimization.delta_batt)
+        self.fedin += self._optimization.pv_to_grid
+        self.from_grid += self._optimization.grid_to_load
+        self.revenue_total += self._optimization.revenue
+        self.reference_total += self._optimization.reference_revenue
+        self.battery_total += self._optimization.energy_storage
+        self.total_avoided_network_fees += self._calculate_avoided_network_fees()
+        self.pv_total += sum(pv_gen)
+        self.consumption_year += sum(load)
+        self.welfare_pv += np.dot(pv_gen, prices)
+        self.welfare_consumption -= np.dot(load, prices)
+        self.welfare_battery_pv += -np.dot(
+            self._optimization.sum_energy_from_grid, prices
+        ) + np.dot(self._optimization.sum_energy_to_grid, prices)
+
     def _calculate_battery_state(self, energy_storage):
-        energy_storage = np.array(energy_storage)
-        energy_storage = np.insert(energy_storage, 0, self.battery.size)
-        state_diff = np.diff(energy_storage)
-        for i in range(len(state_diff)):
-            state_diff[i] = round(state_diff[i], 3)
-            if state_diff[i] > 0:
-                state_diff[i] = 1
-            elif (
-                state_diff[i] < -self.battery.self_discharge * self.battery.size * 1.05
-            ):
-                state_diff[i] = -1
-            else:
-                state_diff[i] = 0
-        return state_diff
+        return kpi.charging_state(
+            energy_storage, self.battery.size, self.battery.self_discharge
+        )
@@ -1,3 +1,9 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
 import numpy as np
 import pandas as pd
 
@@ -7,13 +13,30 @@ from prosumerpolicy.pv import PV
 
 
 class _Input:
-    def __init__(self, duration=24, day=1, loadRow=0):
-        self.pv = PV()
+    """input data of a model, the total_* datasets are read on first access
+
+    With a Dataset the total_* datasets are views of its arrays and no input file is read.
+    """
+
+    def __init__(self, duration=24, day=1, loadRow=0, cache=True, dataset=None):
+        self.pv = PV(profile=lambda: self.total_pv_gen)
         self.battery = Battery()
-        self.total_prices = self.import_prices()
-        self.total_pv_gen = self.import_PV()
-        self.total_load = self.import_Load()
-        self.total_average_load = self.total_load.mean(axis=1)
+        self._cache = cache
+        self._cached_average_load = None
+        self._data_version = (
+            0  # incremented whenever one of the total_* datasets is replaced
+        )
+        self._year_arrays = {}  # name: (key, year array in kW/kWh), see _get_year_array
+        self._total_prices = None
+        self._total_pv_gen = None
+        self._total_load = None
+        self._total_average_load = None
+        self._dataset = dataset  # keeps the memory of the views alive
+        if dataset is not None:
+            self._total_prices = pd.DataFrame({"Price": dataset.prices}, copy=False)
+            self._total_pv_gen = pd.DataFrame({0: dataset.pv_profile}, copy=False)
+            self._total_load = pd.DataFrame(dataset.load, copy=False)
+            self._total_average_load = pd.Series(dataset.average_load, copy=False)
         self._time_duration = duration
         self._day = day
         self.load_row = loadRow
@@ -21,33 +44,167 @@ class _Input:
     def import_Load(self, path=path_load):
         try:
             absPath = gen_path(path)
-            totalload = pd.read_csv(absPath, header=None, delimiter=";")
-            logging.info("Load Successfully Imported from {}".format(path_load))
+            totalload, average = self._read_csv_cached(
+                absPath,
+                lambda: pd.read_csv(absPath, header=None, delimiter=";"),
+                lambda frame: {"average": frame.mean(axis=1).to_numpy()},
+            )
+            if average is not None:
+                self._cached_average_load = pd.Series(average["average"], copy=False)
+            logger.info("Load Successfully Imported from {}".format(path_load))
             return totalload
         except:
-            logging.warning("Load Input from {} Error".format(path_load))
+            logger.warning("Load Input from {} Error".format(path_load))
 
     def import_PV(self, path=path_pv_generation):
         try:
             absPath = gen_path(path)
-            totalPvGen = pd.read_csv(absPath, header=None)
-            print(totalPvGen)
-            logging.info(
+            totalPvGen, _ = self._read_csv_cached(
+                absPath, lambda: pd.read_csv(absPath, header=None)
+            )
+            logger.info(
                 "PV Gen Successfully Imported from {}".format(path_pv_generation)
             )
-            self.pv.pv_profile = totalPvGen
             return totalPvGen
         except:
-            logging.warning("Pv Gen Input from {} Error".format(path_pv_generation))
+            logger.warning("Pv Gen Input from {} Error".format(path_pv_generation))
 
     def import_prices(self, path=path_prices):
         try:
             absPath = gen_path(path)
-            totalPrices = pd.read_csv(absPath, sep=";")
-            logging.info("Prices Successfully Imported from {}".format(path_prices))
+            totalPrices, _ = self._read_csv_cached(
+                absPath, lambda: pd.read_csv(absPath, sep=";")
+            )
+            logger.info("Prices Successfully Imported from {}".format(path_prices))
             return totalPrices
         except:
-            logging.warning("Price Input from {} Error ".format(path_prices))
+            logger.warning("Price Input from {} Error ".format(path_prices))
+
+    def _read_csv_cached(self, path, read, derive=None):
+        """returns the DataFrame parsed by read() and the arrays computed by derive(frame)
+
+        Parsed frames are stored as .npy files (memory mapped when loaded) in a directory of
+        path_cache named after the source file and the SHA-1 of its content, so that later runs
+        skip CSV parsing. Falls back to read() if the cache is disabled or unusable.
+        """
+        if not self._cache:
+            frame = read()
+            return frame, None if derive is None else derive(frame)
+        with open(path, "rb") as stream:
+            digest = hashlib.sha1(stream.read()).hexdigest()
+        name = os.path.splitext(os.path.basename(path))[0]
+        cache_dir = os.path.join(gen_path(path_cache), "{}-{}".format(name, digest))
+        try:
+            return self._load_cached_frame(cache_dir)
+        except (OSError, ValueError, KeyError):
+            pass
+        frame = read()
+        derived = None if derive is None else derive(frame)
+        try:
+            self._store_cached_frame(cache_dir, frame, derived)
+        except OSError:
+            logger.warning("Unable to write input cache to {}".format(cache_dir))
+        return frame, derived
+
+    @staticmethod
+    def _load_cached_frame(cache_dir):
+        with open(os.path.join(cache_dir, "meta.json"), "r") as stream:
+            meta = json.load(stream)
+        if meta["block"]:
+            values = np.load(os.path.join(cache_dir, "values.npy"), mmap_mode="r")
+            frame = pd.DataFrame(values, columns=meta["columns"], copy=False)
+        else:
+            columns = {
+                column: np.load(
+                    os.path.join(cache_dir, "column_{}.npy".format(i)), mmap_mode="r"
+                )
+                for i, column in enumerate(meta["columns"])
+            }
+            frame = pd.DataFrame(columns, columns=meta["columns"], copy=False)
+        derived = {
+            key: np.load(os.path.join(cache_dir, "{}.npy".format(key)), mmap_mode="r")
+            for key in meta["derived"]
+        }
+        return frame, derived or None
+
+    @staticmethod
+    def _store_cached_frame(cache_dir, frame, derived):
+        parent = os.path.dirname(cache_dir)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent)
+        try:
+            block = len(set(frame.dtypes)) == 1 and frame.dtypes.iloc[0] != object
+            if block:  # homogeneous frames are stored as one 2-D array
+                np.save(os.path.join(tmp_dir, "values.npy"), frame.to_numpy())
+            else:
+                for i, column in enumerate(frame.columns):
+                    values = frame[column].to_numpy()
+                    if values.dtype == object:
+                        values = values.astype(str)
+                    np.save(os.path.join(tmp_dir, "column_{}.npy".format(i)), values)
+            for key, values in (derived or {}).items():
+                np.save(os.path.join(tmp_dir, "{}.npy".format(key)), values)
+            meta = {
+                "columns": [
+                    column.item() if hasattr(column, "item") else column
+                    for column in frame.columns
+                ],
+                "block": block,
+                "derived": list(derived or {}),
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as stream:
+                json.dump(meta, stream)
+            os.rename(tmp_dir, cache_dir)  # atomic, concurrent writers keep the first
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @property
+    def total_prices(self):
+        if self._total_prices is None:
+            self._total_prices = self.import_prices()
+        return self._total_prices
+
+    @total_prices.setter
+    def total_prices(self, value):
+        self._total_prices = value
+        self._data_version += 1
+
+    @property
+    def total_pv_gen(self):
+        if self._total_pv_gen is None:
+            self._total_pv_gen = self.import_PV()
+        return self._total_pv_gen
+
+    @total_pv_gen.setter
+    def total_pv_gen(self, value):
+        self._total_pv_gen = value
+        self._data_version += 1
+
+    @property
+    def total_load(self):
+        if self._total_load is None:
+            self._total_load = self.import_Load()
+        return self._total_load
+
+    @total_load.setter
+    def total_load(self, value):
+        self._total_load = value
+        self._data_version += 1
+
+    @property
+    def total_average_load(self):
+        if self._total_average_load is None:
+            load = self.total_load  # may also read the cached average
+            if self._cached_average_load is not None:
+                self._total_average_load = self._cached_average_load
+            elif load is not None:
+                self._total_average_load = load.mean(axis=1)
+        return self._total_average_load
+
+    @total_average_load.setter
+    def total_average_load(self, value):
+        self._total_average_load = value
+        self._data_version += 1
 
     @property
     def pv_gen_list(self):
@@ -83,9 +240,42 @@ class _Input:
 
     @load_row.setter
     def load_row(self, value):
-        logging.info("Load Row Changed to {}".format(value))
+        logger.info("Load Row Changed to {}".format(value))
         self._load_row = value
 
+    def _get_year_array(self, name):
+        """returns the read-only year array of name ("price", "pv_gen" or "load" of the current load
+        row) in kW/kWh, rebuilt only after the datasets, the load row or the PV changed
+        """
+        pv = self.pv
+        if name == "price":
+            key = (self._data_version,)
+        elif name == "pv_gen":
+            key = (self._data_version, id(pv), pv._generation_version)
+        else:
+            key = (self._data_version, self.load_row)
+        cached = self._year_arrays.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if name == "price":
+            values = np.array(self.total_prices["Price"]) / 1000  # in kWh
+        elif name == "pv_gen":
+            values = pv.pv_generation / 1000  # kW
+        elif self.load_row == -1:
+            values = np.array(self.total_average_load) / 1000  # kWh
+        else:
+            values = np.array(self.total_load[self.load_row]) / 1000  # kWh
+        if np.isnan(values).any():
+            logger.warning("{} data contains missing values".format(name))
+        values.flags.writeable = False
+        # the PV is kept referenced so that its id can not be reused while cached
+        self._year_arrays[name] = (key, values, pv)
+        return values
+
+    def get_day_stacked(self, name):
+        """returns (365 x 24) view of the year array of name ("price", "pv_gen" or "load"), one row per day"""
+        return self._get_year_array(name)[: 365 * 24].reshape(365, 24)
+
     def get_price_list(self, day=None, duration=None):
         """returns price list as np.array for specified day and duration"""
         if day is None:
@@ -95,14 +285,16 @@ class _Input:
             duration = self.time_duration
         if day is None or duration is None:
             raise ValueError("Please Specify a day and time series duration")
+        hours = (day - 1) * 24
+        if hours >= 0:
+            return self._get_year_array("price")[hours : hours + duration]
         try:
-            hours = (day - 1) * 24
             price = np.array(self.total_prices["Price"][hours : hours + duration])
             if np.nan in price:
                 raise IOError
             return price / 1000  # in kWh
         except IOError:
-            logging.warning("Price list in day {} contains missing values ".format(day))
+            logger.warning("Price list in day {} contains missing values ".format(day))
 
     def get_load_list(self, day=None, duration=None, load_row=None):
         if day is None:
@@ -114,6 +306,9 @@ class _Input:
         if day is None or duration is None or load_row is None:
             raise ValueError("Please set day, duration and load Row")
 
+        if load_row == self.load_row and day >= 1:
+            hours = (day - 1) * 24
+            return self._get_year_array("load")[hours : hours + duration]
         try:
             if load_row == -1:  ## LOAD ROW -1 gives average load row
                 hours = (day - 1) * 24
@@ -128,7 +323,7 @@ class _Input:
                     raise IOError
                 return load / 1000  # kWh
         except IOError:
-            logging.warning("Load list in day {} contains missing values".format(day))
+            logger.warning("Load list in day {} contains missing values".format(day))
 
     def get_pv_gen_list(self, day=None, duration=None):
         if day is None:
@@ -137,13 +332,15 @@ class _Input:
             duration = self.time_duration
         if day is None or duration is None:
             raise ValueError("Please Specify a day and time series duration")
+        hours = (day - 1) * 24
+        if hours >= 0:
+            return self._get_year_array("pv_gen")[hours : hours + duration]
         try:
-            hours = (day - 1) * 24
-            result = np.array(self.pv._calculatedPvGen[0][hours : hours + duration])
+            result = np.array(self.pv.pv_generation[hours : hours + duration])
             if np.nan in result:
                 raise IOError
             return result / 1000  # kW
         except IOError:
-            logging.warning(
+            logger.warning(
                 "PV Generation list day {} contains missing values.".format(day)
             )
@@ -0,0 +1,88 @@
+import collections
+import threading
+import time
+
+import pandas as pd
+
+""" Per phase timers and counters of the optimizations of a model """
+
+
+class _NoPhase:
+    """context manager that does nothing, used while the instrumentation is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    __slots__ = ("_instrumentation", "_name", "_start")
+
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._instrumentation._add(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class Instrumentation:
+    """wall time and number of calls per phase and event counters of the optimizations
+
+    The phases are "input" (slicing the inputs of a dispatch), "build" (building the solver model),
+    "solve", "duals" (shadow prices), "extract" (reading the flows from the solution) and "frame"
+    (building DataFrames). Phases run in worker threads add up their time, so the sum of the phases
+    may exceed the wall time of a parallel run. Timing is off by default, phase then returns a
+    shared context manager that does nothing.
+
+    counters are always kept as they cost one increment per solve: "solves" of the dispatch, of
+    which "lp" were solved as LP and "milp" with binaries, and "binaries" the binary hours of the
+    lp_first fallbacks.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timers = collections.defaultdict(float)  # seconds per phase
+        self.calls = collections.Counter()  # calls per phase
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """context manager that adds its wall time to phase name while enabled"""
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def _add(self, name, seconds):
+        with self._lock:
+            self.timers[name] += seconds
+            self.calls[name] += 1
+
+    def reset(self):
+        """clears timers and counters, counters stay the same object"""
+        with self._lock:
+            self.timers.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+    def report(self):
+        """returns a DataFrame of seconds and calls per phase"""
+        return pd.DataFrame(
+            {
+                "seconds": pd.Series(dict(self.timers), dtype=float),
+                "calls": pd.Series(dict(self.calls), dtype=int),
+            },
+            columns=["seconds", "calls"],
+        )
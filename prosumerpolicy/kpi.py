@@ -0,0 +1,58 @@
+import numpy as np
+
+""" Battery and system KPIs on whole year arrays, the last axis is time, leading axes are scenarios """
+
+
+def battery_cycles(storage, size, initial_state):
+    """number of full cycles, i.e. throughput of 2*size, of the hourly battery states
+
+    storage is (... x hours), size and initial_state are broadcast against the leading axes.
+    Batteries without size count one cycle per hour.
+    """
+    storage = np.asarray(storage, dtype=float)
+    size = np.asarray(size, dtype=float)
+    previous = np.concatenate(
+        [
+            np.broadcast_to(
+                np.asarray(initial_state, dtype=float)[..., None],
+                storage.shape[:-1] + (1,),
+            ),
+            storage[..., :-1],
+        ],
+        axis=-1,
+    )
+    throughput = np.abs(storage - previous).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cycles = np.floor(throughput / (2 * size))
+    return np.where(size == 0, storage.shape[-1], cycles).astype(int)[()]
+
+
+def charging_state(storage, size, self_discharge):
+    """1 for charging, -1 for discharging and 0 for idle hours of the hourly battery states
+
+    The battery starts full, changes are rounded to Wh and losses up to 1.05 times the self
+    discharge of a full battery count as idle.
+    """
+    storage = np.asarray(storage, dtype=float)
+    size = np.asarray(size, dtype=float)[..., None]
+    start = np.broadcast_to(size, storage.shape[:-1] + (1,))
+    change = np.round(np.diff(np.concatenate([start, storage], axis=-1)), 3)
+    threshold = -np.asarray(self_discharge, dtype=float)[..., None] * size * 1.05
+    return np.where(change > 0, 1.0, np.where(change < threshold, -1.0, 0.0))
+
+
+def csc(charging_state_a, charging_state_b):
+    """charging state correlator of two charging_state arrays: 1 for identical, 0 for opposite"""
+    a = np.asarray(charging_state_a, dtype=float)
+    b = np.asarray(charging_state_b, dtype=float)
+    return (1 - ((a - b) ** 2).sum(axis=-1) / (2 * a.shape[-1]))[()]
+
+
+def self_consumption(fed_in_pv, pv_total):
+    """share of the PV generation that is not fed into the grid"""
+    return (1 - np.asarray(fed_in_pv, dtype=float) / pv_total)[()]
+
+
+def autarky(from_grid_load, consumption):
+    """share of the consumption that is not drawn from the grid"""
+    return (1 - np.asarray(from_grid_load, dtype=float) / consumption)[()]
@@ -2,21 +2,37 @@ import warnings
 
 import numpy as np
 
+from prosumerpolicy import kpi
 from prosumerpolicy.economics import Economics
 from prosumerpolicy.input import _Input
+from prosumerpolicy.instrumentation import Instrumentation
 from prosumerpolicy.optimization import _Optimization
 from prosumerpolicy.policy import Policy
 
 
 class Model:
-    def __init__(self):
-        self._input_setter = _Input()
+    def __init__(self, solver="gurobi", dataset=None):
+        """dataset is an optional Dataset used instead of the input files, e.g. one attached to
+        shared memory"""
+        self.instrumentation = Instrumentation()  # enabled=True times the phases
+        self._input_setter = _Input(dataset=dataset)
         self.policy = Policy(self._input_setter)
-        self._optimization = _Optimization(self._input_setter, self.policy)
+        self._optimization = _Optimization(
+            self._input_setter, self.policy, solver, self.instrumentation
+        )
         self._economics = Economics(self._input_setter, self.policy, self._optimization)
         self.pv = self._input_setter.pv
         self.battery = self._input_setter.battery
 
+    @property
+    def solver(self):
+        """LP/MILP solver used for optimizations: gurobi or highs (open source, shipped with SciPy)"""
+        return self._optimization.solver
+
+    @solver.setter
+    def solver(self, value):
+        self._optimization.solver = value
+
     @property
     def day(self):
         return self._input_setter.day
@@ -81,9 +97,11 @@ class Model:
     @property
     def opt(self):
         if self.policy.is_rtp or self.policy.is_vfit:
-            return self._optimization.optimize()[0]
+            result = self._optimization.optimize()[0]
         else:
-            return self._optimization.optimize()
+            result = self._optimization.optimize()
+        with self.instrumentation.phase("frame"):
+            return result.to_frame()
 
     @property
     def revenue(self):
@@ -99,16 +117,12 @@ class Model:
             warnings.warn("Optimization for year automatically calculated")
             self._economics.optimize_year()
         if self._optimization._optimization_status == 1:  # BAU
-            return (
-                1
-                - sum(self._optimization.energy_to_grid_bau) / self._economics.pv_total
-            )
+            fed_in = sum(self._optimization.energy_to_grid_bau)
         else:
-            return (
-                1
-                - (self._economics.fedin + max(sum(self._economics.delta_batt_grid), 0))
-                / self._economics.pv_total
+            fed_in = self._economics.fedin + max(
+                sum(self._economics.delta_batt_grid), 0
             )
+        return kpi.self_consumption(fed_in, self._economics.pv_total)
 
     @property
     def autarky(self):
@@ -116,20 +130,12 @@ class Model:
             warnings.warn("Optimization for year automatically calculated")
             self._economics.optimize_year()
         if self._optimization._optimization_status == 1:  # BAU
-            return (
-                1
-                - sum(self._optimization.energy_from_grid_bau)
-                / self._economics.consumption_year
-            )
+            from_grid = sum(self._optimization.energy_from_grid_bau)
         else:
-            return (
-                1
-                - (
-                    self._economics.from_grid
-                    - min(sum(self._economics.delta_batt_grid), 0)
-                )
-                / self._economics.consumption_year
+            from_grid = self._economics.from_grid - min(
+                sum(self._economics.delta_batt_grid), 0
             )
+        return kpi.autarky(from_grid, self._economics.consumption_year)
 
     @property
     def MAI(self):
@@ -145,4 +151,4 @@ class Model:
 
     @property
     def storage_dispatch_arbitrage(self):
-        return self._optimization.energyStorageArbitrage
+        return self._optimization.energy_storage_arbitrage
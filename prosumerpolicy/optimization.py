@@ -1,15 +1,389 @@
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
-from gurobipy import *
+
+from prosumerpolicy.arbitrage import arbitrage_cache, arbitrage_dispatch
+from prosumerpolicy.batch import batch_bau
+from prosumerpolicy.instrumentation import Instrumentation
+from prosumerpolicy.paths import *
+from prosumerpolicy.results import _FlowResult
+from prosumerpolicy.solvers import _LinearProgram, _solver_backend
 
 pd.set_option("display.expand_frame_repr", False)
 
+_DISPATCH_FLOWS = (
+    "pv_to_batt",
+    "batt_to_load",
+    "pv_to_load",
+    "pv_to_grid",
+    "batt_to_grid",
+    "grid_to_batt",
+    "storage",
+    "grid_to_load",
+)  # order of the hourly variable blocks of _dispatch_program, followed by the binaries
+
+
+def _storage_balance(battery, n):
+    """returns the (n x n) matrix mapping the storage block onto its balance rows"""
+    import scipy.sparse as sp  # imported on first use, keeps model startup fast
+
+    retention = 1 - battery.self_discharge
+    return sp.identity(n, format="csr") - retention * sp.eye(n, k=-1, format="csr")
+
+
+def _arbitrage_program(battery, prices):
+    """Price arbitrage of the battery with the grid: variables are charge, discharge and storage blocks
+
+    All Efficiencies are taken with reference to the battery. if battery discharges 1kwh, this means it actually gives
+    etaDischarge*1kwh to the grid...if battery charges by 1 kwh, this means it took 1/etacharge from the grid/pv
+    """
+    import scipy.sparse as sp
+
+    prices = np.asarray(prices, dtype=float)
+    n = len(prices)
+    eye = sp.identity(n, format="csr")
+    A = sp.hstack(
+        [
+            -battery.charge_efficiency * eye,
+            eye / battery.discharge_efficiency,
+            _storage_balance(battery, n),
+        ],
+        format="csr",
+    )
+    rhs = np.zeros(n)  # battery starts empty
+    capacity = battery.maximum_charge_discharge_capacity
+    ub = np.concatenate(
+        [
+            np.full(n, capacity / battery.charge_efficiency),
+            np.full(n, capacity * battery.discharge_efficiency),
+            np.full(n, float(battery.size)),
+        ]
+    )
+    c = np.concatenate([-prices, prices, np.zeros(n)])
+    return _LinearProgram(
+        c, A, rhs, rhs, np.zeros(3 * n), ub, np.zeros(3 * n, dtype=bool)
+    )
+
+
+def _dispatch_program(
+    battery, wholesale_price, retail_price, feed_in, pv, load, initial_state=None
+):
+    """Household dispatch with PV, battery and grid: variable blocks as in _DISPATCH_FLOWS, then one binary per hour
+
+    The binary y forbids battery to grid and grid to battery flows in the same hour. The battery
+    starts at initial_state, by default at its initial_battery_capacity.
+    """
+    import scipy.sparse as sp
+
+    n = len(load)
+    eye = sp.identity(n, format="csr")
+    capacity = battery.maximum_charge_discharge_capacity
+    charge_limit = capacity / battery.charge_efficiency
+    discharge_limit = capacity * battery.discharge_efficiency
+    charge = -battery.charge_efficiency * eye
+    discharge = eye / battery.discharge_efficiency
+    A = sp.bmat(
+        [
+            # pv_to_batt, batt_to_load, pv_to_load, pv_to_grid, batt_to_grid, grid_to_batt, storage, grid_to_load, y
+            [
+                charge,
+                discharge,
+                None,
+                None,
+                discharge,
+                charge,
+                _storage_balance(battery, n),
+                None,
+                None,
+            ],  # storage balance
+            [eye, None, eye, eye, None, None, None, None, None],  # PV
+            [None, eye, eye, None, None, None, None, eye, None],  # load
+            [None, None, None, None, eye, None, None, None, -discharge_limit * eye],
+            [None, None, None, None, None, eye, None, None, charge_limit * eye],
+        ],
+        format="csr",
+    )
+    row_lb, row_ub = _dispatch_row_bounds(battery, pv, load, initial_state)
+    inf = np.full(n, np.inf)
+    ub = np.concatenate(
+        [
+            np.full(n, charge_limit),
+            np.full(n, discharge_limit),
+            inf,
+            inf,
+            np.full(n, discharge_limit),
+            np.full(n, charge_limit),
+            np.full(n, float(battery.size)),
+            inf,
+            np.ones(n),
+        ]
+    )
+    c = _dispatch_objective(wholesale_price, retail_price, feed_in)
+    integrality = np.zeros(9 * n, dtype=bool)
+    integrality[8 * n :] = True
+    return _LinearProgram(c, A, row_lb, row_ub, np.zeros(9 * n), ub, integrality)
+
+
+def _shift_dispatch_solution(solution, hours):
+    """start for the dispatch program hours later: every variable block moved forward by hours, the
+    hours at the end unknown (nan)"""
+    blocks = np.asarray(solution).reshape(len(_DISPATCH_FLOWS) + 1, -1)
+    start = np.full(blocks.shape, np.nan)
+    start[:, : blocks.shape[1] - hours] = blocks[:, hours:]
+    return start.ravel()
+
+
+def _dispatch_shadow_prices(battery, solution, row_duals, upper_duals):
+    """hourly change of the dispatch objective per kWh of storage capacity ("storage_capacity"), per kW
+    of charge/discharge power ("power") and per kWh of energy in the storage, PV and load balances
+    ("energy_balance", "pv_balance", "load_balance"), from the duals of the solved program
+    """
+    flows = len(_DISPATCH_FLOWS)
+    n = len(solution) // (flows + 1)
+    upper = upper_duals.reshape(flows + 1, n)
+    rows = row_duals.reshape(5, n)
+    y = solution[flows * n :]
+    block = _DISPATCH_FLOWS.index
+    eta_charge = battery.charge_efficiency
+    eta_discharge = battery.discharge_efficiency
+    power = (
+        (upper[block("pv_to_batt")] + upper[block("grid_to_batt")]) / eta_charge
+        + (upper[block("batt_to_load")] + upper[block("batt_to_grid")]) * eta_discharge
+        + rows[3] * eta_discharge * y  # batt_to_grid <= power * eta_discharge * y
+        + rows[4] * (1 - y) / eta_charge  # grid_to_batt <= power / eta_charge * (1 - y)
+    )
+    return {
+        "storage_capacity": upper[block("storage")],
+        "power": power,
+        "energy_balance": rows[0],
+        "pv_balance": rows[1],
+        "load_balance": rows[2],
+    }
+
+
+def _dispatch_structure(battery, n):
+    """key of everything in _dispatch_program that does not change from day to day"""
+    return (
+        n,
+        battery.size,
+        battery.charge_efficiency,
+        battery.discharge_efficiency,
+        battery.self_discharge,
+        battery.maximum_charge_discharge_capacity,
+    )
+
+
+def _dispatch_objective(wholesale_price, retail_price, feed_in):
+    retail_price = np.asarray(retail_price, dtype=float)
+    zero = np.zeros(len(retail_price))
+    return np.concatenate(
+        [
+            zero,
+            zero,
+            zero,
+            np.asarray(feed_in, dtype=float),
+            np.asarray(wholesale_price, dtype=float),
+            -retail_price,
+            zero,
+            -retail_price,
+            zero,
+        ]
+    )
+
+
+def _dispatch_row_bounds(battery, pv, load, initial_state=None):
+    if initial_state is None:
+        initial_state = battery.initial_battery_capacity
+    n = len(load)
+    initial = np.zeros(n)
+    initial[0] = initial_state * (1 - battery.self_discharge)
+    pv = np.asarray(pv, dtype=float)
+    load = np.asarray(load, dtype=float)
+    charge_limit = battery.maximum_charge_discharge_capacity / battery.charge_efficiency
+    row_lb = np.concatenate([initial, pv, load, np.full(2 * n, -np.inf)])
+    row_ub = np.concatenate([initial, pv, load, np.zeros(n), np.full(n, charge_limit)])
+    return row_lb, row_ub
+
+
+_SIMULTANEOUS_TOLERANCE = 1e-9  # kWh, smaller flows in both directions count as none
+
+
+class _DispatchSolver:
+    """solves daily dispatch programs, reusing one solver model while the structure stays the same
+
+    With lp_first the LP relaxation is solved first. Only if it charges from and discharges to the
+    grid in the same hour the program is solved again with binaries on those hours, until no hour
+    has both flows. statistics counts solves ("lp" solved by the relaxation alone, "milp" solved
+    with binaries, "binaries" binary hours of the lp_first fallbacks). With warm_start every solve
+    starts from the solution of the previous one (Gurobi only). Building, solving and shadow
+    prices are timed by instrumentation.
+    """
+
+    def __init__(
+        self,
+        backend,
+        warm_start=False,
+        lp_first=False,
+        statistics=None,
+        instrumentation=None,
+    ):
+        self._backend = backend
+        self._warm_start = warm_start
+        self.lp_first = lp_first
+        self.statistics = collections.Counter() if statistics is None else statistics
+        self._instrumentation = (
+            Instrumentation() if instrumentation is None else instrumentation
+        )
+        self._structure = None
+        self._model = None
+        self._integrality = None
+
+    def solve(
+        self,
+        battery,
+        wholesale_price,
+        retail_price,
+        feed_in,
+        pv,
+        load,
+        initial_state=None,
+        start=None,
+    ):
+        """returns solution and objective, start is an optional partial MIP start (nan: unknown)"""
+        structure = _dispatch_structure(battery, len(load))
+        with self._instrumentation.phase("build"):
+            if self._model is None or self._structure != structure:
+                program = _dispatch_program(
+                    battery,
+                    wholesale_price,
+                    retail_price,
+                    feed_in,
+                    pv,
+                    load,
+                    initial_state,
+                )
+                self._model = self._backend.model(
+                    program, "RTP_withForesight", self._warm_start
+                )
+                self._structure = structure
+                self._integrality = program.integrality
+            else:  # same structure, only prices, PV and load change
+                self._model.update(
+                    _dispatch_objective(wholesale_price, retail_price, feed_in),
+                    _dispatch_row_bounds(battery, pv, load, initial_state)[1],
+                )
+        n = len(load)
+        if start is not None and len(start) != (len(_DISPATCH_FLOWS) + 1) * n:
+            start = None
+        self.statistics["solves"] += 1
+        if not self.lp_first:
+            self._set_binary_hours(np.ones(n, dtype=bool))
+            self.statistics["milp"] += 1
+            return self._solve(start)
+        binary = np.zeros(n, dtype=bool)
+        self._set_binary_hours(binary)
+        solution, objective = self._solve(start)
+        batt_to_grid = _DISPATCH_FLOWS.index("batt_to_grid")
+        grid_to_batt = _DISPATCH_FLOWS.index("grid_to_batt")
+        while True:
+            flows = solution.reshape(len(_DISPATCH_FLOWS) + 1, n)
+            simultaneous = (flows[batt_to_grid] > _SIMULTANEOUS_TOLERANCE) & (
+                flows[grid_to_batt] > _SIMULTANEOUS_TOLERANCE
+            )
+            if not simultaneous.any():
+                break
+            binary |= simultaneous
+            self._set_binary_hours(binary)
+            solution, objective = self._solve(start)
+        if binary.any():
+            self.statistics["milp"] += 1
+            self.statistics["binaries"] += int(binary.sum())
+        else:
+            self.statistics["lp"] += 1
+        # hours without binary get the y that matches their flows
+        solution = solution.copy()
+        y = solution[len(_DISPATCH_FLOWS) * n :]
+        y[~binary] = flows[batt_to_grid][~binary] > _SIMULTANEOUS_TOLERANCE
+        return solution, objective
+
+    def shadow_prices(self, battery, solution):
+        """returns _dispatch_shadow_prices of solution, the result of the last solve"""
+        with self._instrumentation.phase("duals"):
+            return _dispatch_shadow_prices(battery, solution, *self._model.duals())
+
+    def _solve(self, start):
+        with self._instrumentation.phase("solve"):
+            return self._model.solve(start)
+
+    def _set_binary_hours(self, binary):
+        n = len(binary)
+        integrality = np.zeros((len(_DISPATCH_FLOWS) + 1) * n, dtype=bool)
+        integrality[len(_DISPATCH_FLOWS) * n :] = binary
+        if not np.array_equal(integrality, self._integrality):
+            self._model.set_integrality(integrality)
+            self._integrality = integrality
+
 
 class _Optimization:
-    def __init__(self, input, policy):
+    def __init__(self, input, policy, solver="gurobi", instrumentation=None):
         self._input = input
         self._policy = policy
         self._optimization_status = None
+        self._lp_first = False
+        self._warm_start = False
+        self.instrumentation = (
+            Instrumentation() if instrumentation is None else instrumentation
+        )
+        self.dispatch_statistics = self.instrumentation.counters
+        self.solver = solver
+
+    @property
+    def solver(self):
+        """name of the LP/MILP solver backend: gurobi or highs"""
+        return self._backend.name
+
+    @solver.setter
+    def solver(self, value):
+        self._backend = _solver_backend(value)
+        self._dispatch_solver = self._new_dispatch_solver(self._backend)
+
+    @property
+    def lp_first(self):
+        """solve the dispatch LP relaxation first and add binaries only where needed, see _DispatchSolver"""
+        return self._lp_first
+
+    @lp_first.setter
+    def lp_first(self, value):
+        self._lp_first = value
+        self._dispatch_solver.lp_first = value
+
+    @property
+    def warm_start(self):
+        """start every dispatch solve from the previous solution, see _DispatchSolver
+
+        Solves can be faster, but where a day has several optimal dispatches the one found depends
+        on the order of the solves, e.g. on the number of workers.
+        """
+        return self._warm_start
+
+    @warm_start.setter
+    def warm_start(self, value):
+        self._warm_start = value
+        self._dispatch_solver = self._new_dispatch_solver(self._backend)
+
+    def _new_dispatch_solver(self, backend, statistics=None):
+        if statistics is None:
+            statistics = self.dispatch_statistics
+        return _DispatchSolver(
+            backend,
+            warm_start=self._warm_start,
+            lp_first=self._lp_first,
+            statistics=statistics,
+            instrumentation=self.instrumentation,
+        )
 
     def optimize(self, rtp=None, vfit=None, capacity=None):
         if rtp is None:
@@ -29,122 +403,68 @@ class _Optimization:
         else:
             return self._optimizer_dispatch()
 
-    def _optimize_arbitrage(self):
+    def _optimize_arbitrage(self, method="dp"):
         """
 
         Function takes Maximum Charge Capacity, Max Discharge Capacity, BatterySize, number of hours and
         a random number generator  and price curve as input
 
-        returns maximum revenue along with hourly Energy dispatch from grid,Energy dispatch to grid and battery state
+        returns hourly prices, battery state, energy dispatch from grid and into the grid as _FlowResult
 
-        Complete foresight, linear optimization done with GUROBI SOLVER
+        Complete foresight. method "dp" uses the solver free arbitrage_dispatch, method "lp" solves
+        _arbitrage_program with the solver backend, e.g. for cross-checking. Results are kept in
+        arbitrage_cache, keyed on the prices and battery parameters
 
         """
         self.arbitrage_state = True
-        model = Model("Arbitrage")  # Create Gurobi Model
         prices = self._input.price_list
         N = self._input.time_duration
-        model.setParam("OutputFlag", 0)
-        e_charge, e_discharge, e_storage = {}, {}, {}  # Intialize Constraint Dictionary
-        # All Efficiencies are taken with reference to the battery. if battery discharges 1kwh, this means it actually gives
-        # etaDischarge*1kwh to the grid...if battery charges by 1 kwh, this means it took 1/etacharge from the grid/pv
-        for j in range(
-            N
-        ):  # fills constraint dictionary along with lower and upper bounds
-            e_charge[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.maximum_charge_discharge_capacity
-                / self._input.battery.charge_efficiency,
-                name="ECharge[%s]" % j,
-            )
-            e_discharge[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.maximum_charge_discharge_capacity
-                * self._input.battery.discharge_efficiency,
-                name="EDischarge[%s]" % j,
-            )
-            e_storage[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.size,
-                name="EStorage[%s]" % j,
-            )
-        model.update()
-        # EDischarge and Echarge are directly to the grid
-        # sets objective function
-        model.setObjective(
-            sum(
-                e_discharge[j] * prices[j] - (e_charge[j]) * prices[j] for j in range(N)
-            ),
-            GRB.MAXIMIZE,
-        )
-        for i in range(N):  # Adding constraints for length of N
-            if i == 0:
-                model.addConstr(
-                    e_storage[i]
-                    - 0
-                    * self._input.battery.size
-                    * (1 - self._input.battery.self_discharge)
-                    - e_charge[i] * self._input.battery.charge_efficiency
-                    + e_discharge[i] / self._input.battery.discharge_efficiency
-                    == 0
+        battery = self._input.battery
+        key = arbitrage_cache.key(prices, battery, method)
+        cached = arbitrage_cache.get(key)
+        if cached is not None:
+            efrom_grid, eto_grid, battery_state = cached
+        else:
+            if method == "dp":
+                efrom_grid, eto_grid, battery_state, _ = arbitrage_dispatch(
+                    prices,
+                    battery.size,
+                    battery.maximum_charge_discharge_capacity,
+                    battery.charge_efficiency,
+                    battery.discharge_efficiency,
+                    battery.self_discharge,
                 )
+            elif method == "lp":
+                program = _arbitrage_program(battery, prices)
+                solution, _ = self._backend.model(program, "Arbitrage").solve()
+                efrom_grid, eto_grid, battery_state = solution.reshape(3, N)
             else:
-                model.addConstr(
-                    e_storage[i]
-                    - e_storage[i - 1] * (1 - self._input.battery.self_discharge)
-                    - e_charge[i] * self._input.battery.charge_efficiency
-                    + e_discharge[i] / self._input.battery.discharge_efficiency
-                    == 0
-                )
-        model.update()
-        model.optimize()
-
-        efrom_grid, eto_grid, battery_state = [], [], []
-
-        # data wrangling to extract solution
-        for i in range(N):
-            variables = model.getVarByName("ECharge[%s]" % i)
-            efrom_grid.append(variables.x)
-            variables = model.getVarByName("EDischarge[%s]" % i)
-            eto_grid.append(variables.x)
-            variables = model.getVarByName("EStorage[%s]" % i)
-            battery_state.append(variables.x)
-
-        self.energyStorageArbitrage = np.array(battery_state)
-        self.energyToGridArbitrage = np.array(eto_grid)
-        self.energyFromGridArbitrage = np.array(efrom_grid)
-
-        ans = pd.DataFrame(
-            {
-                "Prices": prices,
-                "Battery State (kW)": battery_state,
-                "Energy from the grid (kW)": efrom_grid,
-                "Energy into the grid (kW)": eto_grid,
-            },
-        )
-        # ans = ans.round(2)
-        ans = ans[
-            [
+                raise ValueError("Unknown arbitrage method {}".format(method))
+            arbitrage_cache.put(key, (efrom_grid, eto_grid, battery_state))
+
+        self.energy_storage_arbitrage = battery_state
+        self.energy_to_grid_arbitrage = eto_grid
+        self.energy_from_grid_arbitrage = efrom_grid
+
+        ans = _FlowResult(
+            (
                 "Prices",
                 "Battery State (kW)",
                 "Energy from the grid (kW)",
                 "Energy into the grid (kW)",
-            ]
-        ]
+            ),
+            (prices, battery_state, efrom_grid, eto_grid),
+        )
         # self.numOfCyclesArb=self.batteryCountsArb()
         return ans
         # return ans, model.objVal  # function returns results as DataFrame and the value of objective function
 
     def _bau(self):
-        logging.info(
-            "Business as Usual: Day {}, Time Duration {}, PV Size {} ".format(
-                self._input.day,
-                self._input.time_duration,
-                self._input.pv.size,
-            )
+        logger.debug(
+            "Business as Usual: Day %s, Time Duration %s, PV Size %s",
+            self._input.day,
+            self._input.time_duration,
+            self._input.pv.size,
         )
         self._optimization_status = 1
 
@@ -156,102 +476,27 @@ class _Optimization:
         length = min(
             len(self._input.pv_gen_list), len(self._input.load_list)
         )  # in case the inputs  are not the same length, use the smaller.
-        batt_state, energy_from_grid, energy_to_grid, cases = (
-            [],
-            [],
-            [],
-            [],
-        )  # Create Return Variables
         xi = self._input.pv_gen_list[:length] - self._input.load_list[:length]
-        battStateATBeg = []
-        # All Efficiencies are taken with reference to the battery. if battery discharges 1kwh, this means it actually gives
-        # etaDischarge*1kwh to the grid...if battery charges by 1 kwh, this means it took 1kwh/etacharge from the grid/pv
-        battery_state = self._input.battery.initial_battery_capacity
-        for item in xi:
-            battAtBeg = battery_state * (1 - self._input.battery.self_discharge)
-            battery_state *= 1 - self._input.battery.self_discharge
-            if item <= 0:
-                e_to_grid = 0
-                if (
-                    abs(item)
-                    <= min(
-                        battery_state,
-                        self._input.battery.maximum_charge_discharge_capacity,
-                    )
-                    * self._input.battery.discharge_efficiency
-                ):
-                    battery_state = battery_state - (
-                        abs(item) / self._input.battery.discharge_efficiency
-                    )
-                    e_from_grid = 0
-                elif (
-                    abs(item)
-                    > min(
-                        battery_state,
-                        self._input.battery.maximum_charge_discharge_capacity,
-                    )
-                    * self._input.battery.discharge_efficiency
-                ):
-                    e_from_grid = (
-                        abs(item)
-                        - min(
-                            battery_state,
-                            self._input.battery.maximum_charge_discharge_capacity,
-                        )
-                        * self._input.battery.discharge_efficiency
-                    )
-                    battery_state = battery_state - (
-                        min(
-                            battery_state,
-                            self._input.battery.maximum_charge_discharge_capacity,
-                        )
-                    )
-            else:
-                e_from_grid = 0
-                if (
-                    item
-                    >= min(
-                        (self._input.battery.size - battery_state),
-                        self._input.battery.maximum_charge_discharge_capacity,
-                    )
-                    / self._input.battery.charge_efficiency
-                ):
-                    e_to_grid = (
-                        item
-                        - min(
-                            (self._input.battery.size - battery_state),
-                            self._input.battery.maximum_charge_discharge_capacity,
-                        )
-                        / self._input.battery.charge_efficiency
-                    )
-                    battery_state = battery_state + min(
-                        (self._input.battery.size - battery_state),
-                        self._input.battery.maximum_charge_discharge_capacity,
-                    )
-                else:
-                    battery_state = (
-                        battery_state + item * self._input.battery.charge_efficiency
-                    )
-                    e_to_grid = 0
-
-            batt_state.append(battery_state)
-            energy_from_grid.append(e_from_grid)
-            energy_to_grid.append(e_to_grid)
-            battStateATBeg.append(battAtBeg)
-
-        ans = pd.DataFrame(
-            {
-                "Price": self._policy.retail_electricity,
-                "load (kW)": self._input.load_list,
-                "PV Generation": self._input.pv_gen_list,
-                "Battery State (kW)": batt_state,
-                "Energy from the grid (kW)": energy_from_grid,
-                "Energy into the grid (kW)": energy_to_grid,
-                "Bat at beg": battStateATBeg,
-            },
+        battery = self._input.battery
+        flows = batch_bau(
+            xi,
+            battery.size,
+            battery.maximum_charge_discharge_capacity,
+            battery.charge_efficiency,
+            battery.discharge_efficiency,
+            battery.self_discharge,
+            battery.initial_battery_capacity,
         )
-        ans = ans[
-            [
+        batt_state = flows["battery_state"][0].tolist()
+        battStateATBeg = flows["battery_at_beginning"][0]
+        energy_from_grid = flows["energy_from_grid"][0]
+        energy_to_grid = flows["energy_to_grid"][0]
+        battery_state = (
+            batt_state[-1] if batt_state else battery.initial_battery_capacity
+        )
+
+        ans = _FlowResult(
+            (
                 "Price",
                 "load (kW)",
                 "PV Generation",
@@ -259,11 +504,17 @@ class _Optimization:
                 "Energy from the grid (kW)",
                 "Energy into the grid (kW)",
                 "Bat at beg",
-            ]
-        ]
-        energy_to_grid = np.array(energy_to_grid)
-        energy_from_grid = np.array(energy_from_grid)
-
+            ),
+            (
+                self._policy.retail_electricity,
+                self._input.load_list,
+                self._input.pv_gen_list,
+                batt_state,
+                energy_from_grid,
+                energy_to_grid,
+                battStateATBeg,
+            ),
+        )
         revenue = (
             np.dot(self._policy.fit, energy_to_grid)
             - np.dot(self._policy.retail_electricity, energy_from_grid)
@@ -282,7 +533,116 @@ class _Optimization:
 
         return ans
 
-    def _optimizer_dispatch(self):
+    def _bau_batch(self, load_rows, pv_sizes, battery_sizes):
+        """Business as Usual dispatch for every combination of load row, PV size and battery size.
+
+        Uses the current day and time duration of the input and the remaining battery parameters.
+        returns the flows of batch_bau with a leading axis of shape
+        (len(load_rows), len(pv_sizes), len(battery_sizes))
+        """
+        load_rows = np.atleast_1d(load_rows)
+        pv_sizes = np.atleast_1d(np.asarray(pv_sizes, dtype=float))
+        battery_sizes = np.atleast_1d(np.asarray(battery_sizes, dtype=float))
+        loads = np.array([self._input.get_load_list(load_row=row) for row in load_rows])
+        hours = (self._input.day - 1) * 24
+        pv_gen = (
+            self._input.pv.pv_generation_for_sizes(pv_sizes)[
+                :, hours : hours + self._input.time_duration
+            ]
+            / 1000
+        )  # pv sizes x hours
+        length = min(pv_gen.shape[1], loads.shape[1])
+        net_load = (
+            pv_gen[None, :, :length] - loads[:, None, :length]
+        )  # load rows x pv sizes x hours
+        shape = (len(load_rows), len(pv_sizes), len(battery_sizes))
+        net_load = np.broadcast_to(net_load[:, :, None, :], shape + (length,))
+        sizes = np.broadcast_to(battery_sizes, shape).ravel()
+        battery = self._input.battery
+        flows = batch_bau(
+            net_load.reshape(-1, length),
+            sizes,
+            sizes / battery.ratio_e2p,
+            battery.charge_efficiency,
+            battery.discharge_efficiency,
+            battery.self_discharge,
+            battery.initial_battery_capacity,
+        )
+        return {key: value.reshape(shape + (length,)) for key, value in flows.items()}
+
+    def _set_solver_threads(self, threads):
+        """limits the dispatch optimizations of this instance to threads solver threads"""
+        self._backend = _solver_backend(self.solver, threads)
+        self._dispatch_solver = self._new_dispatch_solver(self._backend)
+
+    def _dispatch_inputs(self):
+        """returns wholesale price, retail price, feed in tariff, PV generation and load of the current day"""
+        with self.instrumentation.phase("input"):
+            return (
+                self._input.price_list,
+                self._policy.retail_electricity,
+                self._policy.fit,
+                self._input.pv_gen_list,
+                self._input.load_list,
+            )
+
+    def _solve_dispatch_days(self, days, workers, threads=None, shadow_prices=False):
+        """solves the dispatch of the given days on a pool of worker threads
+
+        Each worker solves a contiguous run of days with its own solver backend and reused model,
+        limited to threads solver threads (default: available cores shared among the workers).
+        returns (inputs, solution, objective, shadow prices or None) per day, in the order of days
+        """
+        if threads is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+        inputs = []
+        for day in days:
+            self._input.day = day
+            inputs.append(self._dispatch_inputs())
+        battery = self._input.battery
+
+        def solve_chunk(chunk):
+            solver = self._new_dispatch_solver(
+                _solver_backend(self.solver, threads), collections.Counter()
+            )
+            solved = []
+            for i in chunk:
+                solution, objective = solver.solve(battery, *inputs[i])
+                prices = (
+                    solver.shadow_prices(battery, solution) if shadow_prices else None
+                )
+                solved.append((solution, objective, prices))
+            return solved, solver.statistics
+
+        chunks = np.array_split(np.arange(len(inputs)), workers)
+        solutions = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk_solutions, statistics in pool.map(solve_chunk, chunks):
+                solutions.extend(chunk_solutions)
+                self.dispatch_statistics.update(statistics)
+        return [
+            (day_inputs,) + day_solved
+            for day_inputs, day_solved in zip(inputs, solutions)
+        ]
+
+    def _optimizer_dispatch(
+        self,
+        solved=None,
+        initial_state=None,
+        commit=None,
+        start=None,
+        shadow_prices=False,
+    ):
+        """optimizes the dispatch of the current day and stores the results
+
+        solved optionally holds (inputs, solution, objective, shadow prices) of a dispatch solved
+        beforehand. With shadow_prices the hourly _dispatch_shadow_prices are stored in
+        shadow_prices.
+        The battery starts at initial_state (default: initial_battery_capacity), start is an
+        optional MIP start. If commit is given only the first commit hours of the optimized window
+        are returned and stored, e.g. for a rolling horizon. The full solution is kept in
+        dispatch_solution, the returned flows in flows.
+        """
         self._optimization_status = 2
         if self._policy.is_fixed_network_charges:
             capacity = " Capacity"
@@ -295,235 +655,96 @@ class _Optimization:
             self.optimization_state = "RTP and Variable FIT" + capacity
         elif not self._policy.is_rtp and self._policy.is_vfit:
             self.optimization_state = "Fixed Price and Variable FIT" + capacity
-        logging.info(
-            "Real Time Pricing Optimization: Day {}, Time Duration {}, PV Size {} ".format(
-                self._input.day,
-                self._input.time_duration,
-                self._input.pv.size,
-            )
-        )  # Getting config
-        wholesale_price = self._input.price_list
-        pri = self._policy.retail_electricity
-        load = self._input.load_list
-        PV = self._input.pv_gen_list
-        feed_in = self._policy.fit
-        optimization_duration = self._input.time_duration
-        model = Model("RTP_withForesight")  # Create Gurobi Model
-        model.setParam("OutputFlag", 0)
-        (
-            e_storage,
-            e_pv_to_batt,
-            e_pv_to_load,
-            e_pv_to_grid,
-            e_batt_to_grid,
-            e_batt_to_load,
-            e_grid_to_load,
-            e_grid_to_batt,
-        ) = (
-            {},
-            {},
-            {},
-            {},
-            {},
-            {},
-            {},
-            {},
-        )  # Initialize Constraint Dictionary
-        y = {}
-        """ All Efficiencies are taken with reference to the battery. if battery discharges 1kwh,
-         this means it actually gives etaDischarge*1kwh to the grid...if battery charges by 1 kwh, this means it
-          took 1/etacharge from the grid/pv
-        """
-
-        for j in range(
-            optimization_duration
-        ):  # creates variables along with lower and upper bounds
-            y[j] = model.addVar(vtype="b")
-            e_pv_to_batt[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.maximum_charge_discharge_capacity
-                / self._input.battery.charge_efficiency,
-                name="e_p_vto_batt[%s]" % j,
-            )
-            e_batt_to_load[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.maximum_charge_discharge_capacity
-                * self._input.battery.discharge_efficiency,
-                name="e_batt_to_load[%s]" % j,
-            )
-            e_pv_to_load[j] = model.addVar(vtype="C", lb=0, name="ePVtoLoad[%s]" % j)
-            e_pv_to_grid[j] = model.addVar(vtype="C", lb=0, name="e_pv_to_grid[%s]" % j)
-            e_batt_to_grid[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.maximum_charge_discharge_capacity
-                * self._input.battery.discharge_efficiency,
-                name="e_battto_grid[%s]" % j,
-            )
-            e_grid_to_batt[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.maximum_charge_discharge_capacity
-                / self._input.battery.charge_efficiency,
-                name="e_grid_to_batt[%s]" % j,
-            )
-            e_storage[j] = model.addVar(
-                vtype="C",
-                lb=0,
-                ub=self._input.battery.size,
-                name="e_storage[%s]" % j,
-            )
-            e_grid_to_load[j] = model.addVar(
-                vtype="C", lb=0, name="e_grid_to_load[%s]" % j
+        logger.debug(  # formatted only if enabled, runs for every day of a year
+            "Real Time Pricing Optimization: Day %s, Time Duration %s, PV Size %s",
+            self._input.day,
+            self._input.time_duration,
+            self._input.pv.size,
+        )
+        if solved is None:
+            inputs = self._dispatch_inputs()
+            solution, objective = self._dispatch_solver.solve(
+                self._input.battery, *inputs, initial_state=initial_state, start=start
             )
-
-        model.update()
-
-        model.setObjective(
-            sum(
-                e_batt_to_grid[j] * wholesale_price[j]
-                - e_grid_to_batt[j] * pri[j]
-                + feed_in[j] * e_pv_to_grid[j]
-                - pri[j] * e_grid_to_load[j]
-                for j in range(optimization_duration)
-            ),
-            GRB.MAXIMIZE,
-        )  # set objective function maximizing revenue
-        for i in range(
-            optimization_duration
-        ):  # Adding energy constraints for length of optimization_duration
-            if i == 0:  # intial value
-                model.addConstr(
-                    e_storage[i]
-                    - self._input.battery.initial_battery_capacity
-                    * (1 - self._input.battery.self_discharge)
-                    - e_pv_to_batt[i] * self._input.battery.charge_efficiency
-                    - e_grid_to_batt[i] * self._input.battery.charge_efficiency
-                    + e_batt_to_load[i] / self._input.battery.discharge_efficiency
-                    + e_batt_to_grid[i] / self._input.battery.discharge_efficiency
-                    == 0
+            if shadow_prices:
+                prices = self._dispatch_solver.shadow_prices(
+                    self._input.battery, solution
                 )
-            else:
-                model.addConstr(
-                    e_storage[i]
-                    - e_storage[i - 1] * (1 - self._input.battery.self_discharge)
-                    - e_pv_to_batt[i] * self._input.battery.charge_efficiency
-                    - e_grid_to_batt[i] * self._input.battery.charge_efficiency
-                    + e_batt_to_load[i] / self._input.battery.discharge_efficiency
-                    + e_batt_to_grid[i] / self._input.battery.discharge_efficiency
-                    == 0
-                )
-            model.addConstr(
-                e_pv_to_load[i] + e_pv_to_batt[i] + e_pv_to_grid[i] == PV[i]
-            )
-            model.addConstr(
-                e_grid_to_load[i] + e_batt_to_load[i] + e_pv_to_load[i] == load[i]
-            )
-            model.addConstr(
-                e_batt_to_grid[i]
-                <= self._input.battery.maximum_charge_discharge_capacity
-                * y[i]
-                * self._input.battery.discharge_efficiency
-            )
-            model.addConstr(
-                e_grid_to_batt[i]
-                <= self._input.battery.maximum_charge_discharge_capacity
-                * (1 - y[i])
-                / self._input.battery.charge_efficiency
+        else:
+            inputs, solution, objective, prices = solved
+        with self.instrumentation.phase("extract"):
+            self.dispatch_solution = solution
+            if shadow_prices:
+                self.shadow_prices = {
+                    name: values[:commit] for name, values in prices.items()
+                }
+            wholesale_price, pri, feed_in, PV, load = (
+                np.asarray(values)[:commit] for values in inputs
             )
-
-        model.update()
-        model.optimize()
-
-        if model.status == GRB.Status.INF_OR_UNBD:
-            # Turn presolve off to determine whether model is infeasible
-            # or unbounded
-            model.setParam(GRB.Param.Presolve, 0)
-            model.optimize()
-            print(model.status)
-        # #extracting optimization results. Pretty ugly
-        (
-            pv_to_grid,
-            PVtoLoad,
-            PVtoBatt,
-            BatttoLoad,
-            batt_to_grid,
-            BatteryState,
-            grid_to_load,
-            grid_to_batt,
-        ) = ([], [], [], [], [], [], [], [])
-        for i in range(optimization_duration):
-            vars = model.getVarByName("e_p_vto_batt[%s]" % i)
-            PVtoBatt.append(vars.x)
-            vars = model.getVarByName("e_batt_to_load[%s]" % i)
-            BatttoLoad.append(vars.x)
-            vars = model.getVarByName("ePVtoLoad[%s]" % i)
-            PVtoLoad.append(vars.x)
-            vars = model.getVarByName("e_pv_to_grid[%s]" % i)
-            pv_to_grid.append(vars.x)
-            vars = model.getVarByName("e_battto_grid[%s]" % i)
-            batt_to_grid.append(vars.x)
-            vars = model.getVarByName("e_grid_to_batt[%s]" % i)
-            grid_to_batt.append(vars.x)
-            vars = model.getVarByName("e_storage[%s]" % i)
-            BatteryState.append(vars.x)
-            vars = model.getVarByName("e_grid_to_load[%s]" % i)
-            grid_to_load.append(vars.x)
-
-        ans = pd.DataFrame(
-            {
-                "Prices": pri,
-                "load": load,
-                "PV": PV,
-                "Feed in": feed_in,
-                "Battery State (kW)": BatteryState,
-                "Energy PV to Batt (kW)": PVtoBatt,
-                "Energy PV to Load (kW)": PVtoLoad,
-                "Energy PV to Grid (kW)": pv_to_grid,
-                "Energy Battery to Grid (kW)": batt_to_grid,
-                "Energy Battery to Load (kW)": BatttoLoad,
-                "Energy Grid to Load (kW)": grid_to_load,
-                "Energy Grid to Batt (kW)": grid_to_batt,
-            },
-        )
-
-        ans = ans[
-            [
-                "Prices",
-                "load",
-                "PV",
-                "Feed in",
-                "Battery State (kW)",
-                "Energy PV to Batt (kW)",
-                "Energy PV to Load (kW)",
-                "Energy PV to Grid (kW)",
-                "Energy Battery to Grid (kW)",
-                "Energy Battery to Load (kW)",
-                "Energy Grid to Load (kW)",
-                "Energy Grid to Batt (kW)",
+            hours = len(inputs[-1])
+            (
+                PVtoBatt,
+                BatttoLoad,
+                PVtoLoad,
+                pv_to_grid,
+                batt_to_grid,
+                grid_to_batt,
+                BatteryState,
+                grid_to_load,
+            ) = solution[: len(_DISPATCH_FLOWS) * hours].reshape(
+                len(_DISPATCH_FLOWS), hours
+            )[
+                :, :commit
             ]
-        ]
 
-        self.energy_storage = BatteryState  # used for SFI
-        self.revenue = (
-            np.dot(self._policy.fit, pv_to_grid)
-            + np.dot(self._input.price_list, batt_to_grid)
-            - np.dot(self._policy.retail_electricity, grid_to_load)
-            - np.dot(self._policy.retail_electricity, grid_to_batt)
-        )
-        self.sum_energy_from_grid = np.array(grid_to_load) + np.array(
-            grid_to_batt
-        )  # used for avoided network costs
-        self.sum_energy_to_grid = np.array(pv_to_grid) + np.array(batt_to_grid)
-        self.delta_batt = sum(np.array(batt_to_grid) - np.array(grid_to_batt))
-        self.pv_to_grid = sum(pv_to_grid)
-        self.grid_to_load = sum(grid_to_load)
-        self.reference_revenue = np.dot(
-            -self._policy.retail_electricity, self._input.load_list
-        )
+            ans = _FlowResult(
+                (
+                    "Prices",
+                    "load",
+                    "PV",
+                    "Feed in",
+                    "Battery State (kW)",
+                    "Energy PV to Batt (kW)",
+                    "Energy PV to Load (kW)",
+                    "Energy PV to Grid (kW)",
+                    "Energy Battery to Grid (kW)",
+                    "Energy Battery to Load (kW)",
+                    "Energy Grid to Load (kW)",
+                    "Energy Grid to Batt (kW)",
+                ),
+                (
+                    pri,
+                    load,
+                    PV,
+                    feed_in,
+                    BatteryState,
+                    PVtoBatt,
+                    PVtoLoad,
+                    pv_to_grid,
+                    batt_to_grid,
+                    BatttoLoad,
+                    grid_to_load,
+                    grid_to_batt,
+                ),
+            )
+
+            self.energy_storage = BatteryState.tolist()  # used for SFI
+            self.revenue = (
+                np.dot(feed_in, pv_to_grid)
+                + np.dot(wholesale_price, batt_to_grid)
+                - np.dot(pri, grid_to_load)
+                - np.dot(pri, grid_to_batt)
+            )
+            self.sum_energy_from_grid = (
+                grid_to_load + grid_to_batt
+            )  # used for avoided network costs
+            self.sum_energy_to_grid = pv_to_grid + batt_to_grid
+            self.delta_batt = sum(batt_to_grid - grid_to_batt)
+            self.pv_to_grid = sum(pv_to_grid)
+            self.grid_to_load = sum(grid_to_load)
+            self.reference_revenue = np.dot(-pri, load)
+        self.flows = ans
         return (
             ans,
-            model.objVal,
-        )  # function returns results as DataFrame and the value of objective function
+            objective,
+        )  # function returns results as _FlowResult and the value of objective function
@@ -1,3 +1,4 @@
+import copy
 import logging
 import os.path
 
@@ -5,20 +6,16 @@ import yaml
 
 """ Sets the Paths of the input data """
 
-logging.basicConfig(
-    filename="logger.log",
-    filemode="w",
-    level=logging.CRITICAL,
-    format=" %(asctime)s -  %(levelname)s-  %(message)s",
-)
-
-formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+# messages of the package, the application configures handlers and levels
+logger = logging.getLogger("prosumerpolicy")
+logger.addHandler(logging.NullHandler())
 
 
 path_prices = "../data/market_data_2016.csv"  # Market Prices Paths
 path_load = "../data/summed_load_profiles.csv"  # Consumption Load Profiles Path
 path_pv_generation = "../data/generation_data.csv"  # PV Generation Path
 path_parameters = "../example/parameters.yaml"  # parameter Path
+path_cache = "../data/.cache"  # binary cache of parsed input data
 
 
 def gen_path(path):
@@ -29,11 +26,22 @@ def gen_path(path):
     return str(path)
 
 
+_parsed_parameters = {}  # path: ((modification time, size), parsed parameters)
+
+
 def read_parameters(path):
-    with open(path, "r") as stream:
-        try:
-            parameters = yaml.safe_load(stream)
-            return parameters
-        except yaml.YAMLError as exc:
-            print("I/O Error, Unable to retrieve data from {}".format(path))
-            print(exc)
+    """returns a copy of the parameters in the YAML file path, parsed once per version of the file"""
+    status = os.stat(path)
+    version = (status.st_mtime_ns, status.st_size)
+    cached = _parsed_parameters.get(path)
+    if cached is None or cached[0] != version:
+        with open(path, "r") as stream:
+            try:
+                parameters = yaml.safe_load(stream)
+            except yaml.YAMLError as exc:
+                logger.error(
+                    "I/O Error, Unable to retrieve data from {}: {}".format(path, exc)
+                )
+                return None
+        cached = _parsed_parameters[path] = (version, parameters)
+    return copy.deepcopy(cached[1])
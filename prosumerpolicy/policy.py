@@ -18,17 +18,15 @@ class Policy:
         self.fixed_capacity = None
         self.electricity_base_price = None
         self._parameters = None
+        self._year_constants = None  # (key, (c, alpha, beta), pv profile)
         self._set_policy_parameters_from_file(path)
-        self._c = self._calculate_electricity_constant()
-        self._alpha = self._calculate_eeg_ratio()
-        self._beta = self._calculate_feedIn_ratio()
 
     def _set_policy_parameters_from_file(self, path=None):
         """update attributes from file"""
         if path is None:
             path = gen_path(path_parameters)
         self._parameters = read_parameters(path)
-        logging.info("Loaded Policy config Set From {}".format(path))
+        logger.info("Loaded Policy config Set From {}".format(path))
         parameters_policy = self._parameters["policy"]
         parameters_economic = self._parameters["economics"]
         self.fixed_fit = float(parameters_policy["fixed_fit"])  # eur/kwh
@@ -50,7 +48,7 @@ class Policy:
                 float(parameters_policy["capacity_case"]["fixed_capacity"])
                 * parameters_economic["vat"]
             )
-            logging.info("No Network Charges Imposed")
+            logger.info("No Network Charges Imposed")
         else:
             self.network_charge = float(
                 parameters_policy["volumetric_case"]["network_charge"]
@@ -59,7 +57,7 @@ class Policy:
                 float(parameters_policy["volumetric_case"]["fixed_capacity"])
                 * parameters_economic["vat"]
             )  # eur per KW per year
-            logging.info("Volumetric Network Charges Imposed")
+            logger.info("Volumetric Network Charges Imposed")
         self.vat = parameters_economic["vat"]
         self.is_rtp = bool(parameters_policy["is_rtp"])
         self.is_fixed_network_charges = bool(parameters_policy["is_capacity"])
@@ -79,7 +77,7 @@ class Policy:
     def is_rtp(self, value):
         value = bool(value)
         self._is_rtp = value
-        logging.info("RTP Status Changed to {}".format(str(value)))
+        logger.info("RTP Status Changed to {}".format(str(value)))
 
     @property
     def is_fixed_network_charges(self):
@@ -89,7 +87,7 @@ class Policy:
     def is_fixed_network_charges(self, value):
         value = bool(value)
         self._is_fixed_network_charges = value
-        logging.info("Capacity Status Changed to {}".format(str(value)))
+        logger.info("Capacity Status Changed to {}".format(str(value)))
 
     @property
     def is_vfit(self):
@@ -99,7 +97,7 @@ class Policy:
     def is_vfit(self, value):
         value = bool(value)
         self._is_vfit = value
-        logging.info("Feed in Status Changed to {}".format(str(value)))
+        logger.info("Feed in Status Changed to {}".format(str(value)))
 
     @property
     def fit(self):
@@ -109,38 +107,54 @@ class Policy:
     def retail_electricity(self):
         return self._calculate_retail_electricity_prices()
 
-    def _calculate_electricity_constant(self):
+    @property
+    def _c(self):
+        return self._get_year_constants()[0]
+
+    @property
+    def _alpha(self):
+        return self._get_year_constants()[1]
+
+    @property
+    def _beta(self):
+        return self._get_year_constants()[2]
+
+    def _get_year_constants(self):
+        """returns (c, alpha, beta), recalculated only if the input data, PV or policy parameters changed"""
+        pv = self._input.pv
+        key = (
+            self._input._data_version,
+            id(pv),
+            pv._generation_version,
+            self.electricity_wholesale,
+            self._component_levy_fit,
+            self.fixed_fit,
+        )
+        if self._year_constants is None or self._year_constants[0] != key:
+            # the PV is kept referenced so that its id can not be reused while cached
+            self._year_constants = (key, self._calculate_year_constants(), pv)
+        return self._year_constants[1]
+
+    def _calculate_year_constants(self):
+        """calculates price constant c, EEG ratio alpha and feed in ratio beta in one pass over the year"""
         total_avg_load = self._input.get_load_list(day=1, duration=8760, load_row=-1)
         total_price = self._input.get_price_list(day=1, duration=8760)
+        total_pv = self._input.get_pv_gen_list(day=1, duration=8760)
+        sum_avg_load = sum(total_avg_load)
         c = (
-            self.electricity_wholesale * sum(total_avg_load)
+            self.electricity_wholesale * sum_avg_load
             - np.dot(total_avg_load, total_price)
-        ) / sum(
-            total_avg_load
-        )  # constant added of price
-        return c
-
-    def _calculate_eeg_ratio(self):
-        total_avg_load = self._input.get_load_list(day=1, duration=8760, load_row=-1)
-        total_price = self._input.get_price_list(day=1, duration=8760)
-        c = self._calculate_electricity_constant()
+        ) / sum_avg_load  # constant added of price
         alpha = (
             self._component_levy_fit
-            * sum(total_avg_load)
+            * sum_avg_load
             / np.dot((total_price + c), total_avg_load)
         )
-        return alpha
-
-    def _calculate_feedIn_ratio(self):
-        total_price = self._input.get_price_list(day=1, duration=8760)
-        total_pv = self._input.get_pv_gen_list(day=1, duration=8760)
-        c = self._calculate_electricity_constant()
         beta = self.fixed_fit * sum(total_pv) / (np.dot((total_price + c), total_pv))
-        return beta
+        return c, alpha, beta
 
     def _calculate_feed_in_tariff(self):
         if self.is_vfit:
-            logging.warning(" Variable FIT Set")
             self.__FIT = self._beta * (
                 self._input.get_price_list() + self._c
             )  # coefficient obtained by dividing total feed in remuneration to realtime prices times production
@@ -153,9 +167,11 @@ class Policy:
         parameters = self._parameters
         parameters_policy = parameters["policy"]
         if self.is_vfit and self.is_rtp:
-            self._component_levy_fit = self._alpha * (
+            component_levy_fit = self._alpha * (
                 self._input.get_price_list() + self._c
             )  # 2.3 calculated by dividing total eeg umlage by realtime prices and load
+        else:
+            component_levy_fit = self._component_levy_fit
         if self.is_fixed_network_charges:
             self.network_charge = float(
                 parameters_policy["capacity_case"]["network_charge"]
@@ -164,7 +180,6 @@ class Policy:
                 float(parameters_policy["capacity_case"]["fixed_capacity"])
                 * parameters["economics"]["vat"]
             )
-            logging.info("Capacity Network Charges Imposed")
         else:
             self.network_charge = float(
                 parameters_policy["volumetric_case"]["network_charge"]
@@ -173,25 +188,14 @@ class Policy:
                 float(parameters_policy["volumetric_case"]["fixed_capacity"])
                 * parameters["economics"]["vat"]
             )  # eur per KW per year
-            logging.info("Volumetric Network Charges Imposed")
         if self.is_rtp:
             self.electricity_base_price = self._input.get_price_list() + self._c
-            logging.info(
-                "Real Time Pricing for Day {} and Time Duration {} Set ".format(
-                    self._input.day, self._input.time_duration
-                )
-            )
         else:
             fixed_prices = [self.electricity_wholesale] * self._input.time_duration
             fixed_prices = np.array(fixed_prices)
             self.electricity_base_price = fixed_prices
-            logging.info(
-                "Constant Prices for day {} and Time Duration {}".format(
-                    self._input.day, self._input.time_duration
-                )
-            )
         total = (
-            self._component_levy_fit
+            component_levy_fit
             + self.taxes
             + self.electricity_base_price
             + self.network_charge
@@ -1,12 +1,18 @@
+import numpy as np
+
 from prosumerpolicy.paths import *
 
 
 class PV:
-    def __init__(self, path=None):
-        """Sets parameter from default values"""
-        logging.info("PV config are set")
+    def __init__(self, path=None, profile=None):
+        """Sets parameter from default values, profile is an optional function returning the
+        generation profile on first use"""
+        logger.info("PV config are set")
+        self._generation = None  # cached pv_generation, reset by every setter below
+        self._generation_version = 0  # incremented whenever pv_generation changes
+        self._load_profile = profile
         self.pv_profile = None
-        self.__size = None
+        self.size = None
         self.irradiation = None
         self.performance_ratio = None
         self.gamma = None
@@ -21,14 +27,14 @@ class PV:
         self.irradiation = parameters["irradiation"]
         self.performance_ratio = parameters["performance_ratio"]
         self.gamma = parameters["gamma"]
-        logging.info("PV config Set From {}".format(path))
+        logger.info("PV config Set From {}".format(path))
 
     def update_parameters(self, path):
         self._set_pv_parameters_from_file(path)
 
     def _calculate_pv_generation(self):
         """calculates PvGen based on PV __parameters"""
-        logging.info("PV Generation for PV Size {} kW is calculated".format(self.size))
+        logger.info("PV Generation for PV Size {} kW is calculated".format(self.size))
         return (
             self.pv_profile
             * self.size
@@ -40,3 +46,82 @@ class PV:
     @property
     def _calculatedPvGen(self):
         return self._calculate_pv_generation()
+
+    def _invalidate_generation(self):
+        self._generation = None
+        self._generation_version += 1
+
+    @property
+    def pv_profile(self):
+        """generation profile per unit, replace (do not modify) it to update the generation"""
+        if self._pv_profile is None and self._load_profile is not None:
+            self._pv_profile = self._load_profile()
+        return self._pv_profile
+
+    @pv_profile.setter
+    def pv_profile(self, value):
+        self._pv_profile = value
+        if value is not None:
+            self._load_profile = None  # replaced by the user
+        self._invalidate_generation()
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        self._size = value
+        self._invalidate_generation()
+
+    @property
+    def irradiation(self):
+        return self._irradiation
+
+    @irradiation.setter
+    def irradiation(self, value):
+        self._irradiation = value
+        self._invalidate_generation()
+
+    @property
+    def performance_ratio(self):
+        return self._performance_ratio
+
+    @performance_ratio.setter
+    def performance_ratio(self, value):
+        self._performance_ratio = value
+        self._invalidate_generation()
+
+    @property
+    def gamma(self):
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, value):
+        self._gamma = value
+        self._invalidate_generation()
+
+    @property
+    def pv_generation(self):
+        """hourly generation of the first profile column as read-only array, calculated once per parameter set"""
+        if self._generation is None:
+            generation = np.array(self._calculatedPvGen[0], dtype=float)
+            generation.flags.writeable = False
+            self._generation = generation
+        return self._generation
+
+    def pv_generation_per_kw(self):
+        """hourly generation per kW installed as array"""
+        return (
+            np.asarray(self.pv_profile[0], dtype=float)
+            * self.irradiation
+            * self.gamma
+            * self.performance_ratio
+        )
+
+    def pv_generation_for_sizes(self, sizes):
+        """hourly generation for each of the PV sizes as (len(sizes) x hours) array, outer product of
+        sizes and pv_generation_per_kw"""
+        return np.multiply.outer(
+            np.asarray(sizes, dtype=float), self.pv_generation_per_kw()
+        )
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+""" Compact results of the dispatch optimizations """
+
+
+class _FlowResult:
+    """hourly series of one optimization as rows of a contiguous array, one row per column
+
+    Series are read with result[column], the DataFrame is only built by to_frame.
+    """
+
+    __slots__ = ("columns", "values", "_frame")
+
+    def __init__(self, columns, series):
+        self.columns = tuple(columns)
+        self.values = np.vstack([np.asarray(values, dtype=float) for values in series])
+        self._frame = None
+
+    @classmethod
+    def from_values(cls, columns, values):
+        """result on the (columns x hours) array values without copying, e.g. a memory map"""
+        result = cls.__new__(cls)
+        result.columns = tuple(columns)
+        result.values = values
+        result._frame = None
+        return result
+
+    @classmethod
+    def concatenate(cls, results):
+        """joins results with the same columns of consecutive windows into one"""
+        return cls.from_values(
+            results[0].columns, np.hstack([result.values for result in results])
+        )
+
+    def __getitem__(self, column):
+        return self.values[self.columns.index(column)]
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def to_frame(self):
+        """returns the series as DataFrame with one column each, built on first use"""
+        if self._frame is None:
+            self._frame = pd.DataFrame(
+                dict(zip(self.columns, self.values)), columns=list(self.columns)
+            )
+        return self._frame
@@ -0,0 +1,263 @@
+import numpy as np
+
+from prosumerpolicy.optimization import (
+    _DISPATCH_FLOWS,
+    _dispatch_objective,
+    _storage_balance,
+)
+from prosumerpolicy.paths import *
+from prosumerpolicy.solvers import _LinearProgram
+
+""" Cost optimal battery (and PV) size from one LP over the dispatch of many days """
+
+_SIZES = ("battery_size", "power", "pv_size")
+
+
+def annuity_factor(discount, lifetime):
+    """share of an investment paid back every year over lifetime years at discount rate"""
+    if discount == 0:
+        return 1 / lifetime
+    return discount / (1 - (1 + discount) ** -lifetime)
+
+
+def _sizing_program(
+    battery,
+    days,
+    weight,
+    battery_cost,
+    pv_cost,
+    power_cost,
+    max_battery_size=np.inf,
+    max_pv_size=np.inf,
+):
+    """LP of the dispatch of the given days with battery size, power and PV size as variables
+
+    days is a list of (wholesale price, retail price, feed in, PV generation per kW, PV generation, load)
+    per day. Every day starts at initial_battery_capacity as in the daily dispatch. The revenue is
+    weighted by weight, e.g. 365/len(days) for representative days, and the sizes cost battery_cost
+    per kWh, power_cost per kW and pv_cost per kW and year. power_cost None ties the power to the
+    battery size by its E2P ratio, pv_cost None keeps the PV generation fixed. The variables are the
+    blocks of _DISPATCH_FLOWS over all hours followed by battery size, power and PV size.
+    """
+    import scipy.sparse as sp  # imported on first use, keeps model startup fast
+
+    hours = [len(day[-1]) for day in days]
+    n = sum(hours)
+    eye = sp.identity(n, format="csr")
+    zero = sp.csr_matrix((n, 3))
+    charge = -battery.charge_efficiency * eye
+    discharge = eye / battery.discharge_efficiency
+    wholesale, retail, feed_in, pv_per_kw, pv, load = (
+        np.concatenate([np.asarray(day[i], dtype=float) for day in days])
+        for i in range(6)
+    )
+    initial = np.zeros(n)
+    initial[np.cumsum([0] + hours[:-1])] = battery.initial_battery_capacity * (
+        1 - battery.self_discharge
+    )
+    storage_balance = sp.block_diag(
+        [_storage_balance(battery, h) for h in hours], format="csr"
+    )
+    sizes = np.zeros((n, 3))
+    sizes[:, 2] = -pv_per_kw if pv_cost is not None else 0.0
+    pv_rhs = np.zeros(n) if pv_cost is not None else pv
+    storage_limit = np.zeros((n, 3))
+    storage_limit[:, 0] = -1
+    charge_limit = np.zeros((n, 3))
+    charge_limit[:, 1] = -1 / battery.charge_efficiency
+    discharge_limit = np.zeros((n, 3))
+    discharge_limit[:, 1] = -battery.discharge_efficiency
+    blocks = [
+        # pv_to_batt, batt_to_load, pv_to_load, pv_to_grid, batt_to_grid, grid_to_batt, storage, grid_to_load, sizes
+        [charge, discharge, None, None, discharge, charge, storage_balance, None, zero],
+        [eye, None, eye, eye, None, None, None, None, sp.csr_matrix(sizes)],  # PV
+        [None, eye, eye, None, None, None, None, eye, zero],  # load
+        [None, None, None, None, None, None, eye, None, sp.csr_matrix(storage_limit)],
+        [eye, None, None, None, None, None, None, None, sp.csr_matrix(charge_limit)],
+        [None, None, None, None, None, eye, None, None, sp.csr_matrix(charge_limit)],
+        [None, eye, None, None, None, None, None, None, sp.csr_matrix(discharge_limit)],
+        [None, None, None, None, eye, None, None, None, sp.csr_matrix(discharge_limit)],
+    ]
+    row_lb = [initial, pv_rhs, load] + [np.full(n, -np.inf)] * 5
+    row_ub = [initial, pv_rhs, load] + [np.zeros(n)] * 5
+    if power_cost is None:  # power = battery size / E2P ratio
+        blocks.append(
+            [None] * len(_DISPATCH_FLOWS)
+            + [sp.csr_matrix([[-1 / battery.ratio_e2p, 1.0, 0.0]])]
+        )
+        row_lb.append(np.zeros(1))
+        row_ub.append(np.zeros(1))
+    A = sp.bmat(blocks, format="csr")
+    c = np.concatenate(
+        [
+            weight
+            * _dispatch_objective(wholesale, retail, feed_in)[
+                : len(_DISPATCH_FLOWS) * n
+            ],
+            [-battery_cost, -(power_cost or 0.0), -(pv_cost or 0.0)],
+        ]
+    )
+    ub = np.full(len(c), np.inf)
+    ub[-3] = max_battery_size
+    ub[-1] = max_pv_size if pv_cost is not None else 0.0
+    row_lb = np.concatenate(row_lb)
+    row_ub = np.concatenate(row_ub)
+    return _LinearProgram(
+        c, A, row_lb, row_ub, np.zeros(len(c)), ub, np.zeros(len(c), dtype=bool)
+    )
+
+
+def _average_cost(invest, scaling_factor, size):
+    """investment per kW(h) of a system of size, invest * (size / 10) ** scaling_factor"""
+    return invest * (size / 10) ** scaling_factor
+
+
+def _investment(invest, scaling_factor, size):
+    """investment into a system of size as in Economics"""
+    if size == 0:
+        return 0.0
+    return size * _average_cost(invest, scaling_factor, size)
+
+
+def optimize_size(
+    economics,
+    optimize_pv=False,
+    power_cost=None,
+    days=None,
+    max_battery_size=np.inf,
+    max_pv_size=np.inf,
+    max_iterations=20,
+    tolerance=1e-3,
+):
+    """cost optimal battery size, and with optimize_pv PV size, for the policy of economics
+
+    The dispatch of days (default: the whole year, otherwise representative days whose revenue is
+    scaled to a year) is optimized together with the sizes in one LP per iteration with the
+    solver backend of the model. The simultaneity binaries of the dispatch are relaxed. Investments
+    are annualized with the discount rate and lifetime of economics and include VAT and O&M, battery
+    replacements are not included. As the investment per kW(h) falls with the size, it is linearized
+    at the average cost of the current sizes and the LP is solved again until the sizes change by
+    less than tolerance. If the iterations cycle between sizes, the sizes of the highest revenue
+    net of the actual annual cost are returned.
+    The sizes are optimal for the cost optimal dispatch, also for a policy without RTP and VFIT,
+    whose year is otherwise evaluated with the rule based BAU dispatch. With optimize_pv the PV
+    size is unbounded if feeding in pays more than the PV costs, max_pv_size limits it then.
+
+    returns dict of battery_size, power, pv_size, annual revenue of the dispatch, annual cost of the
+    sizes and the number of iterations
+    """
+    input = economics._input
+    optimization = economics._optimization
+    battery = economics.battery
+    pv = economics.pv
+    if days is None:
+        days = range(1, 366)
+    days = list(days)
+    annuity = annuity_factor(economics._discount, economics._lifetime)
+    battery_factor = economics._vat * annuity + economics._o_and_m_bat
+    pv_factor = economics._vat * annuity + economics._o_and_m_pv
+
+    day, time = input.day, input.time_duration
+    pv_per_kw = pv.pv_generation_per_kw() / 1000
+    dispatch_days = []
+    try:
+        input.time_duration = 24
+        for d in days:
+            input.day = d
+            wholesale, retail, feed_in, pv_gen, load = optimization._dispatch_inputs()
+            hours = (d - 1) * 24
+            dispatch_days.append(
+                (
+                    wholesale,
+                    retail,
+                    feed_in,
+                    pv_per_kw[hours : hours + 24],
+                    pv_gen,
+                    load,
+                )
+            )
+    finally:
+        input.day, input.time_duration = day, time
+
+    def annual_cost(battery_size, power, pv_size):
+        cost = battery_factor * _investment(
+            economics._invest_Bat, economics._scaling_factor_battery, battery_size
+        ) + power * (power_cost or 0.0)
+        if optimize_pv:
+            cost += pv_factor * _investment(
+                economics._invest_PV, economics._scaling_factor_pv, pv_size
+            )
+        return cost
+
+    # sizes the investment is linearized at, an empty system keeps the previous ones as its
+    # average cost is unbounded
+    battery_size = battery.size if battery.size > 0 else 10.0
+    pv_size = pv.size if pv.size > 0 else 10.0
+    visited = [(battery_size, pv_size)]
+    best = None
+    for iteration in range(1, max_iterations + 1):
+        battery_cost = battery_factor * _average_cost(
+            economics._invest_Bat, economics._scaling_factor_battery, battery_size
+        )
+        pv_cost = (
+            pv_factor
+            * _average_cost(economics._invest_PV, economics._scaling_factor_pv, pv_size)
+            if optimize_pv
+            else None
+        )
+        program = _sizing_program(
+            battery,
+            dispatch_days,
+            365 / len(days),
+            battery_cost,
+            pv_cost,
+            power_cost,
+            max_battery_size,
+            max_pv_size,
+        )
+        try:
+            solution, objective = optimization._backend.model(program, "Sizing").solve()
+        except RuntimeError as error:
+            if optimize_pv and np.isinf(max_pv_size):
+                raise ValueError(
+                    "Sizing failed, the PV size is unbounded if its feed in revenue exceeds its "
+                    "cost, pass a finite max_pv_size"
+                ) from error
+            raise
+        new_battery_size, power, new_pv_size = np.maximum(solution[-3:], 0.0)
+        if not optimize_pv:
+            new_pv_size = float(pv.size)
+        revenue = (
+            objective + new_battery_size * battery_cost + power * (power_cost or 0.0)
+        )
+        if optimize_pv:
+            revenue += new_pv_size * pv_cost
+        cost = annual_cost(new_battery_size, power, new_pv_size)
+        logger.info(
+            "Sizing iteration {}: battery {} kWh, power {} kW, PV {} kW, net revenue {}".format(
+                iteration, new_battery_size, power, new_pv_size, revenue - cost
+            )
+        )
+        if best is None or revenue - cost > best["revenue"] - best["cost"]:
+            best = dict(
+                zip(_SIZES, (new_battery_size, power, new_pv_size)),
+                revenue=revenue,
+                cost=cost,
+            )
+        if new_battery_size > tolerance:
+            battery_size = new_battery_size
+        if new_pv_size > tolerance:
+            pv_size = new_pv_size
+        # the same sizes again: converged, or cycling between sizes of which best is kept
+        if any(
+            abs(battery_size - b) < tolerance and abs(pv_size - p) < tolerance
+            for b, p in visited
+        ):
+            break
+        visited.append((battery_size, pv_size))
+    else:
+        logger.warning(
+            "Sizing did not converge in {} iterations".format(max_iterations)
+        )
+    best["iterations"] = iteration
+    return best
@@ -0,0 +1,245 @@
+import numpy as np
+
+""" LP/MILP solver backends used by _Optimization """
+
+_BOUND_TOLERANCE = 1e-9  # variables this close to their upper bound are at the bound
+_GUROBI_STATUS = {  # gurobipy.GRB.Status codes without a solution
+    3: "model is infeasible",
+    4: "model is infeasible or unbounded",
+    5: "model is unbounded",
+}
+
+
+class _LinearProgram:
+    """maximize c @ x  subject to  row_lb <= A @ x <= row_ub,  lb <= x <= ub,  x[integrality] binary"""
+
+    def __init__(self, c, A, row_lb, row_ub, lb, ub, integrality):
+        self.c = c
+        self.A = A
+        self.row_lb = row_lb
+        self.row_ub = row_ub
+        self.lb = lb
+        self.ub = ub
+        self.integrality = integrality
+
+
+class _GurobiModel:
+    """Gurobi model of a _LinearProgram built once with the matrix API.
+
+    Objective and row bounds can be updated for re-solving a program of the same structure.
+    Each solve starts from scratch, so that its result does not depend on earlier solves, unless
+    warm_start is set, in which case it starts from the previous solution.
+    """
+
+    def __init__(self, program, name, env=None, warm_start=False):
+        from gurobipy import GRB, Model
+
+        self._GRB = GRB
+        self._model = Model(name, env=env)  # Create Gurobi Model
+        self.name = name
+        self._model.setParam("OutputFlag", 0)
+        self._x = self._model.addMVar(
+            len(program.c),
+            lb=program.lb,
+            ub=program.ub,
+            obj=program.c,
+            vtype=np.where(program.integrality, GRB.BINARY, GRB.CONTINUOUS),
+        )
+        self._model.ModelSense = GRB.MAXIMIZE
+        equality = program.row_lb == program.row_ub
+        self._constraints = self._model.addMConstr(
+            program.A,
+            self._x,
+            np.where(equality, GRB.EQUAL, GRB.LESS_EQUAL),
+            program.row_ub,
+        )
+        self._warm_start = warm_start
+        self._has_start = False
+        self._solution = None
+
+    def update(self, c, row_ub):
+        self._x.Obj = c
+        self._constraints.RHS = row_ub
+
+    def set_integrality(self, integrality):
+        """makes the variables where integrality is True binary and all others continuous"""
+        self._x.VType = np.where(integrality, self._GRB.BINARY, self._GRB.CONTINUOUS)
+
+    def solve(self, start=None):
+        """start optionally gives a MIP start, nan entries are left to the solver"""
+        if self._solution is not None and not self._warm_start:
+            self._model.reset()
+        if start is not None:
+            self._x.Start = np.where(np.isnan(start), self._GRB.UNDEFINED, start)
+            self._has_start = True
+        elif self._warm_start and self._solution is not None:
+            self._x.Start = self._solution
+        elif self._has_start:
+            self._x.Start = self._GRB.UNDEFINED
+            self._has_start = False
+        self._model.optimize()
+        if self._model.status == self._GRB.Status.INF_OR_UNBD:
+            # Turn presolve off to determine whether model is infeasible
+            # or unbounded, and back on for the next solves of the model
+            self._model.setParam(self._GRB.Param.Presolve, 0)
+            self._model.optimize()
+            self._model.setParam(self._GRB.Param.Presolve, -1)
+        if self._model.SolCount == 0:
+            raise RuntimeError(
+                "Gurobi could not solve {}: {}".format(
+                    self.name,
+                    _GUROBI_STATUS.get(self._model.status, self._model.status),
+                )
+            )
+        self._solution = self._x.X
+        return self._solution, self._model.objVal
+
+    def duals(self):
+        """returns the change of the objective per unit of each row bound and of each variable upper
+        bound at the last solution; a MIP is evaluated as LP with its integer variables fixed
+        """
+        if self._model.IsMIP:
+            model = self._model.fixed()
+            model.setParam("OutputFlag", 0)
+            model.optimize()
+            variables = model.getVars()
+            pi = np.array(model.getAttr("Pi", model.getConstrs()))
+            rc = np.array(model.getAttr("RC", variables))
+            x = np.array(model.getAttr("X", variables))
+            ub = np.array(model.getAttr("UB", variables))
+        else:
+            pi, rc, x, ub = self._constraints.Pi, self._x.RC, self._x.X, self._x.UB
+        return pi, np.where(x >= ub - _BOUND_TOLERANCE, rc, 0.0)
+
+
+class _HighsModel:
+    """_LinearProgram solved with the open source HiGHS solver shipped with SciPy.
+
+    HiGHS is called through scipy.optimize.milp, which builds its model on every solve, so
+    keeping the program only saves rebuilding the constraint matrix. HiGHS runs single threaded
+    and does not take a warm start or MIP start here.
+    """
+
+    def __init__(self, program, name, threads=None, warm_start=False):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        self._milp = milp
+        self._Bounds = Bounds
+        self._LinearConstraint = LinearConstraint
+        self._program = program
+        self.name = name
+
+    def update(self, c, row_ub):
+        program = self._program
+        row_lb = np.where(program.row_lb == program.row_ub, row_ub, program.row_lb)
+        self._program = type(program)(
+            c, program.A, row_lb, row_ub, program.lb, program.ub, program.integrality
+        )
+
+    def set_integrality(self, integrality):
+        program = self._program
+        self._program = type(program)(
+            program.c,
+            program.A,
+            program.row_lb,
+            program.row_ub,
+            program.lb,
+            program.ub,
+            np.asarray(integrality, dtype=bool),
+        )
+
+    def solve(self, start=None):
+        program = self._program
+        result = self._milp(
+            -program.c,  # milp minimizes
+            constraints=self._LinearConstraint(
+                program.A, program.row_lb, program.row_ub
+            ),
+            integrality=program.integrality.astype(int),
+            bounds=self._Bounds(program.lb, program.ub),
+        )
+        if not result.success:
+            raise RuntimeError(
+                "HiGHS could not solve {}: {}".format(self.name, result.message)
+            )
+        self._solution = result.x
+        return result.x, -result.fun
+
+    def duals(self):
+        """returns the change of the objective per unit of each row bound and of each variable upper
+        bound at the last solution; a MIP is evaluated as LP with its integer variables fixed
+        """
+        from scipy.optimize import linprog
+
+        program = self._program
+        lb = np.asarray(program.lb, dtype=float).copy()
+        ub = np.asarray(program.ub, dtype=float).copy()
+        fixed = np.round(self._solution[program.integrality])
+        lb[program.integrality] = fixed
+        ub[program.integrality] = fixed
+        equality = program.row_lb == program.row_ub
+        A = program.A.tocsr()
+        result = linprog(
+            -program.c,  # linprog minimizes
+            A_ub=A[~equality],
+            b_ub=program.row_ub[~equality],
+            A_eq=A[equality],
+            b_eq=program.row_ub[equality],
+            bounds=np.column_stack([lb, ub]),
+            method="highs",
+        )
+        if not result.success:
+            raise RuntimeError(
+                "HiGHS could not solve the duals of {}: {}".format(
+                    self.name, result.message
+                )
+            )
+        rows = np.empty(len(equality))
+        rows[equality] = -result.eqlin.marginals
+        rows[~equality] = -result.ineqlin.marginals
+        return rows, -result.upper.marginals
+
+
+class _GurobiBackend:
+    """Gurobi solver, with its own environment limited to threads threads if threads is given"""
+
+    name = "gurobi"
+
+    def __init__(self, threads=None):
+        self.threads = threads
+        self._env = None
+
+    def model(self, program, name, warm_start=False):
+        if self.threads is not None and self._env is None:
+            from gurobipy import Env
+
+            self._env = Env(empty=True)
+            self._env.setParam("OutputFlag", 0)
+            self._env.setParam("Threads", self.threads)
+            self._env.start()
+        return _GurobiModel(program, name, self._env, warm_start)
+
+
+class _HighsBackend:
+    """HiGHS solver through SciPy, needs no license"""
+
+    name = "highs"
+
+    def __init__(self, threads=None):
+        self.threads = threads
+
+    def model(self, program, name, warm_start=False):
+        return _HighsModel(program, name, self.threads, warm_start)
+
+
+_BACKENDS = {backend.name: backend for backend in (_GurobiBackend, _HighsBackend)}
+
+
+def _solver_backend(name, threads=None):
+    """returns a new backend for solver name ("gurobi" or "highs")"""
+    try:
+        return _BACKENDS[name](threads)
+    except KeyError:
+        raise ValueError(
+            "Unknown solver {}, choose one of {}".format(name, ", ".join(_BACKENDS))
+        )
@@ -0,0 +1,169 @@
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from prosumerpolicy.archive import FlowWriter
+from prosumerpolicy.dataset import Dataset
+from prosumerpolicy.input import _Input
+from prosumerpolicy.model import Model
+
+KPIS = ("npv", "irr", "self_consumption", "autarky", "MAI")
+
+_SCENARIO_ATTRIBUTES = {  # scenario parameter: (object of the model, attribute)
+    "load_row": (lambda model: model, "load_row"),
+    "pv_size": (lambda model: model.pv, "size"),
+    "battery_size": (lambda model: model.battery, "size"),
+    "is_rtp": (lambda model: model.policy, "is_rtp"),
+    "is_vfit": (lambda model: model.policy, "is_vfit"),
+    "is_fixed_network_charges": (
+        lambda model: model.policy,
+        "is_fixed_network_charges",
+    ),
+}
+
+# Model, its default scenario values and KPIs of the current worker process
+_worker = {}
+
+
+def scenario_grid(**values):
+    """returns the Cartesian product of the given lists as list of scenario dicts
+
+    e.g. scenario_grid(load_row=[0, 1], pv_size=[5, 10], is_rtp=[False, True])
+    """
+    _check_scenario(values)
+    keys = list(values)
+    return [
+        dict(zip(keys, combination))
+        for combination in itertools.product(*(values[key] for key in keys))
+    ]
+
+
+def iter_sweep(
+    scenarios,
+    kpis=KPIS,
+    processes=None,
+    max_pending=None,
+    solver="gurobi",
+    flows=None,
+):
+    """evaluates the KPIs, names of KPIS, of each scenario dict on a pool of processes
+
+    Each process keeps one Model which is reconfigured for every scenario, parameters a scenario
+    leaves out keep the defaults of the parameter files. The input data is read
+    once and shared with the processes as a Dataset in shared memory. At most max_pending
+    scenarios (default: twice the number of processes) are in flight, so that scenarios can be
+    an iterator of any length. With processes=1 everything runs in the current process.
+    solver selects the backend of the worker models, e.g. "highs" for license free workers.
+    With flows, the path of a new directory, the hourly flows of the year of every scenario are
+    streamed into a FlowWriter archive there, read it with FlowArchive.
+    yields one dict of scenario values and KPIs per scenario, in the order of scenarios
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * processes
+    kpis = tuple(kpis)
+    for kpi in kpis:
+        if kpi not in KPIS:
+            raise ValueError("Unknown KPI {}".format(kpi))
+    if isinstance(
+        scenarios, (list, tuple)
+    ):  # iterators are checked as they are evaluated
+        for scenario in scenarios:
+            _check_scenario(scenario)
+    evaluated = _evaluate_all(
+        scenarios, kpis, processes, max_pending, solver, flows is not None
+    )
+    if flows is None:
+        for _, (result, _) in evaluated:
+            yield result
+        return
+    with FlowWriter(flows) as writer:
+        for scenario, (result, hourly_flows) in evaluated:
+            writer.write(hourly_flows, scenario)
+            yield result
+
+
+def _evaluate_all(scenarios, kpis, processes, max_pending, solver, flows):
+    """yields scenario and result of _evaluate per scenario, in the order of scenarios"""
+    if processes == 1:
+        _init_worker(kpis, solver, flows=flows)
+        for scenario in scenarios:
+            yield scenario, _evaluate(scenario)
+        return
+    with Dataset.from_input(_Input()).share() as shared, ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(kpis, solver, shared.handle, flows),
+    ) as pool:
+        pending = collections.deque()
+        for scenario in scenarios:
+            pending.append((scenario, pool.submit(_evaluate, scenario)))
+            if len(pending) >= max_pending:
+                scenario, future = pending.popleft()
+                yield scenario, future.result()
+        while pending:
+            scenario, future = pending.popleft()
+            yield scenario, future.result()
+
+
+def sweep(
+    scenarios, kpis=KPIS, processes=None, max_pending=None, solver="gurobi", flows=None
+):
+    """returns a DataFrame with one row of scenario values and KPIs per scenario
+
+    scenarios is a list or iterator of scenario dicts (see scenario_grid) or a dict of lists,
+    which is expanded to its Cartesian product. flows as in iter_sweep.
+    """
+    if isinstance(scenarios, dict):
+        scenarios = scenario_grid(**scenarios)
+    return pd.DataFrame(
+        list(iter_sweep(scenarios, kpis, processes, max_pending, solver, flows))
+    )
+
+
+def _check_scenario(scenario):
+    """raises ValueError if scenario, a dict, has a key that is no scenario parameter"""
+    for key in scenario:
+        if key not in _SCENARIO_ATTRIBUTES:
+            raise ValueError("Unknown scenario parameter {}".format(key))
+
+
+def _init_worker(kpis, solver, dataset=None, flows=False):
+    """creates the Model of the worker, on the shared Dataset of handle dataset if given"""
+    assert all(kpi in KPIS for kpi in kpis)  # checked by iter_sweep
+    if dataset is not None:
+        dataset = Dataset.attach(dataset)
+    model = Model(solver, dataset)
+    model._optimization._set_solver_threads(1)  # processes already use the cores
+    _worker["model"] = model
+    _worker["defaults"] = {
+        key: getattr(target(model), name)
+        for key, (target, name) in _SCENARIO_ATTRIBUTES.items()
+    }
+    _worker["kpis"] = kpis
+    _worker["flows"] = flows
+
+
+def _evaluate(scenario):
+    """returns the result dict of scenario and, if the worker keeps flows, its hourly flows"""
+    model = _worker["model"]
+    _check_scenario(scenario)
+    # parameters left out are reset, results must not depend on the previous scenario
+    for key, value in dict(_worker["defaults"], **scenario).items():
+        target, name = _SCENARIO_ATTRIBUTES[key]
+        if getattr(target(model), name) != value:
+            setattr(target(model), name, value)
+    economics = model._economics
+    economics.optimize_year(flows=_worker["flows"])
+    economics._is_optimize_year = True  # all KPIs share this year optimization
+    try:
+        result = dict(scenario)
+        for kpi in _worker["kpis"]:
+            result[kpi] = getattr(model, kpi)
+        return result, economics.hourly_flows
+    finally:
+        economics._is_optimize_year = False